@@ -3,10 +3,19 @@ Business Items API
 业务事项管理API
 """
 from fastapi import APIRouter, HTTPException
-from typing import List, Optional
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from typing import List, Optional, Tuple
+from collections import Counter, OrderedDict
 from datetime import datetime
-import json
+import bisect
+import itertools
 import os
+import sqlite3
+import threading
+import time
+
+import orjson
 from app.models.business_item import (
     BusinessItem,
     CreateBusinessItemRequest,
@@ -19,56 +28,240 @@ from app.models.business_item import (
 
 router = APIRouter()
 
+_ITEM_ADAPTER = TypeAdapter(BusinessItem)
+
+# 列表接口的单条序列化结果缓存：(id, updated_at) -> JSON bytes
+# 事项每次修改都会刷新 updated_at，旧条目不会再被命中，按LRU淘汰即可
+ITEM_JSON_CACHE_SIZE = 2048
+_item_json_cache: "OrderedDict[Tuple[str, Optional[str]], bytes]" = OrderedDict()
+
 # 数据存储路径
 DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
-ITEMS_FILE = os.path.join(DATA_DIR, "business_items.json")
+ITEMS_DB = os.path.join(DATA_DIR, "business_items.db")
+ITEMS_FILE = os.path.join(DATA_DIR, "business_items.json")  # 旧版JSON存储，首次启动时导入SQLite
+
+# 常用筛选/排序字段单独成列（可建索引），完整事项以JSON保存在 json 列
+# 筛选索引末尾带 updated_at：按条件筛选后可直接沿索引取最新的limit条，无需排序全部命中行
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    type TEXT,
+    status TEXT,
+    priority TEXT,
+    source TEXT,
+    updated_at TEXT,
+    due_date TEXT,
+    json TEXT NOT NULL
+);
+DROP INDEX IF EXISTS idx_items_status_prio;
+CREATE INDEX IF NOT EXISTS idx_items_status_prio_updated ON items(status, priority, updated_at);
+CREATE INDEX IF NOT EXISTS idx_items_type_updated ON items(type, updated_at);
+CREATE INDEX IF NOT EXISTS idx_items_updated ON items(updated_at DESC);
+"""
+
+# 已存在的ID按主键原地更新（INSERT OR REPLACE 会先删后插，重写整行和全部索引项）
+_UPSERT_SQL = (
+    "INSERT INTO items (id, type, status, priority, source, updated_at, due_date, json) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(id) DO UPDATE SET type = excluded.type, status = excluded.status, "
+    "priority = excluded.priority, source = excluded.source, updated_at = excluded.updated_at, "
+    "due_date = excluded.due_date, json = excluded.json"
+)
+
+
+def _item_row(item: dict) -> tuple:
+    """事项字典 -> items 表的一行"""
+    return (
+        item["id"],
+        item.get("type"),
+        item.get("status"),
+        item.get("priority"),
+        item.get("source"),
+        item.get("updated_at"),
+        item.get("due_date"),
+        orjson.dumps(item).decode()
+    )
 
 
-def _load_items() -> List[dict]:
-    """加载业务事项"""
+# 删除产生的空闲页超过该比例时回收（相当于日志存储的定期压缩）
+COMPACT_FREE_RATIO = 0.3
+
+_conn: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+# ID序列号：同一纳秒内并发创建也不会重复
+_id_seq = itertools.count()
+_id_lock = threading.Lock()
+
+
+def _new_id(prefix: str) -> str:
+    """生成唯一ID：纳秒时间戳 + 进程内递增序号"""
+    with _id_lock:
+        seq = next(_id_seq)
+    return f"{prefix}_{time.time_ns()}_{seq:06x}"
+
+
+def _get_conn() -> sqlite3.Connection:
+    """获取SQLite连接（首次调用时建表，并导入旧版JSON数据）"""
+    global _conn
+    if _conn is None:
+        with _db_lock:
+            if _conn is None:
+                os.makedirs(DATA_DIR, exist_ok=True)
+                conn = sqlite3.connect(ITEMS_DB, check_same_thread=False)
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # 仅对新建的数据库生效
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                _import_legacy_items(conn)
+                _conn = conn
+    return _conn
+
+
+def _import_legacy_items(conn: sqlite3.Connection):
+    """数据库为空且存在旧版JSON文件时，一次性导入"""
     if not os.path.exists(ITEMS_FILE):
-        return []
+        return
+    if conn.execute("SELECT 1 FROM items LIMIT 1").fetchone():
+        return
 
     try:
-        with open(ITEMS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(ITEMS_FILE, "rb") as f:
+            items = orjson.loads(f.read())
+        with conn:
+            conn.executemany(_UPSERT_SQL, [_item_row(item) for item in items])
+        print(f"✅ 已从JSON导入 {len(items)} 条业务事项")
+    except Exception as e:
+        print(f"⚠️  导入旧版业务事项失败: {e}")
+
+
+def _select_items(
+    columns: str,
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    source: Optional[str] = None,
+    limit: Optional[int] = None
+) -> List[tuple]:
+    """按条件查询 items 表的指定列（按更新时间倒序），筛选、排序和数量限制都在SQLite中完成"""
+    clauses = []
+    params: list = []
+    for column, value in (("type", type), ("status", status), ("priority", priority), ("source", source)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+
+    sql = f"SELECT {columns} FROM items"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY updated_at DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+
+    try:
+        conn = _get_conn()
+        with _db_lock:
+            return conn.execute(sql, params).fetchall()
     except Exception as e:
         print(f"⚠️  加载业务事项失败: {e}")
         return []
 
 
-def _save_items(items: List[dict]):
-    """保存业务事项"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-
+def query_items(
+    type: Optional[str] = None,
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    source: Optional[str] = None,
+    limit: Optional[int] = None
+) -> List[dict]:
+    """按条件查询业务事项（按更新时间倒序）"""
+    rows = _select_items("json", type=type, status=status, priority=priority, source=source, limit=limit)
+    return [orjson.loads(row[0]) for row in rows]
+
+
+def _item_json(item_id: str, updated_at: Optional[str], raw: str) -> bytes:
+    """单条事项校验后的JSON（命中缓存时跳过解析、校验和序列化）"""
+    key = (item_id, updated_at)
+    data = _item_json_cache.get(key)
+    if data is None:
+        data = _ITEM_ADAPTER.dump_json(_ITEM_ADAPTER.validate_json(raw))
+        _item_json_cache[key] = data
+        if len(_item_json_cache) > ITEM_JSON_CACHE_SIZE:
+            _item_json_cache.popitem(last=False)
+    else:
+        _item_json_cache.move_to_end(key)
+    return data
+
+
+def _data_version() -> Tuple[int, int]:
+    """数据版本：本连接的累计修改行数 + 其他连接的提交计数，任一变化即说明数据已变"""
+    conn = _get_conn()
+    with _db_lock:
+        return conn.total_changes, conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _maybe_compact(conn: sqlite3.Connection):
+    """空闲页占比过高时增量回收磁盘空间（调用方需持有 _db_lock）"""
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free_pages and free_pages > COMPACT_FREE_RATIO * conn.execute("PRAGMA page_count").fetchone()[0]:
+        conn.execute("PRAGMA incremental_vacuum")
+
+
+def _get_item(item_id: str) -> Optional[dict]:
+    """按ID读取单个业务事项"""
+    conn = _get_conn()
+    with _db_lock:
+        row = conn.execute("SELECT json FROM items WHERE id = ?", (item_id,)).fetchone()
+    return orjson.loads(row[0]) if row else None
+
+
+def _save_item(item: dict):
+    """写入（新增或覆盖）单个业务事项"""
     try:
-        with open(ITEMS_FILE, "w", encoding="utf-8") as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
+        conn = _get_conn()
+        with _db_lock, conn:
+            conn.execute(_UPSERT_SQL, _item_row(item))
     except Exception as e:
         print(f"⚠️  保存业务事项失败: {e}")
         raise HTTPException(status_code=500, detail=f"保存失败: {str(e)}")
 
 
+def _delete_item(item_id: str) -> bool:
+    """删除单个业务事项，返回是否存在"""
+    try:
+        conn = _get_conn()
+        with _db_lock, conn:
+            cursor = conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+        if cursor.rowcount:
+            with _db_lock:
+                _maybe_compact(conn)
+        return cursor.rowcount > 0
+    except Exception as e:
+        print(f"⚠️  删除业务事项失败: {e}")
+        raise HTTPException(status_code=500, detail=f"删除失败: {str(e)}")
+
+
 @router.post("/create", response_model=BusinessItem)
 async def create_item(req: CreateBusinessItemRequest):
     """创建业务事项"""
-    items = _load_items()
-
     # 生成ID
-    item_id = f"item_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{len(items)}"
+    item_id = _new_id("item")
+
+    now_iso = datetime.now().isoformat()
 
     # 创建事项
     item = {
         "id": item_id,
         "title": req.title,
         "description": req.description,
-        "type": req.type,
-        "priority": req.priority,
-        "status": ItemStatus.PENDING,
+        "type": req.type.value,
+        "priority": req.priority.value,
+        "status": ItemStatus.PENDING.value,
         "source": req.source,
         "source_id": req.source_id,
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat(),
+        "created_at": now_iso,
+        "updated_at": now_iso,
         "due_date": req.due_date,
         "completed_at": None,
         "assignee": req.assignee,
@@ -76,8 +269,7 @@ async def create_item(req: CreateBusinessItemRequest):
         "tags": req.tags or []
     }
 
-    items.append(item)
-    _save_items(items)
+    _save_item(item)
 
     print(f"✅ 创建业务事项: {item['title']} ({item['type']})")
 
@@ -93,83 +285,71 @@ async def list_items(
     limit: int = 100
 ):
     """获取业务事项列表"""
-    items = _load_items()
-
-    # 过滤
-    if type:
-        items = [item for item in items if item.get("type") == type]
-
-    if status:
-        items = [item for item in items if item.get("status") == status]
-
-    if priority:
-        items = [item for item in items if item.get("priority") == priority]
-
-    if source:
-        items = [item for item in items if item.get("source") == source]
-
-    # 按更新时间倒序
-    items.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-
-    # 限制数量
-    items = items[:limit]
+    # 过滤、按更新时间倒序、限制数量（枚举先取出字符串值，存储和比较都只用普通字符串）
+    rows = _select_items(
+        "id, updated_at, json",
+        type=type.value if type else None,
+        status=status.value if status else None,
+        priority=priority.value if priority else None,
+        source=source,
+        limit=limit
+    )
 
-    return [BusinessItem(**item) for item in items]
+    # 拼接每条事项缓存的JSON；直接返回Response，FastAPI不再按response_model重复校验
+    return Response(
+        content=b"[" + b",".join(_item_json(*row) for row in rows) + b"]",
+        media_type="application/json"
+    )
 
 
 @router.get("/{item_id}", response_model=BusinessItem)
 async def get_item(item_id: str):
     """获取单个业务事项"""
-    items = _load_items()
-
-    for item in items:
-        if item.get("id") == item_id:
-            return BusinessItem(**item)
+    item = _get_item(item_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="业务事项不存在")
 
-    raise HTTPException(status_code=404, detail="业务事项不存在")
+    return BusinessItem(**item)
 
 
 @router.put("/{item_id}", response_model=BusinessItem)
 async def update_item(item_id: str, req: UpdateBusinessItemRequest):
     """更新业务事项"""
-    items = _load_items()
-
     # 查找事项
-    found = False
-    for i, item in enumerate(items):
-        if item.get("id") == item_id:
-            found = True
-
-            # 更新字段
-            if req.title is not None:
-                item["title"] = req.title
-            if req.description is not None:
-                item["description"] = req.description
-            if req.priority is not None:
-                item["priority"] = req.priority
-            if req.status is not None:
-                item["status"] = req.status
-                # 如果状态变为已完成，记录完成时间
-                if req.status == ItemStatus.COMPLETED and not item.get("completed_at"):
-                    item["completed_at"] = datetime.now().isoformat()
-            if req.due_date is not None:
-                item["due_date"] = req.due_date
-            if req.assignee is not None:
-                item["assignee"] = req.assignee
-            if req.tags is not None:
-                item["tags"] = req.tags
-            if req.metadata is not None:
-                item["metadata"] = {**item.get("metadata", {}), **req.metadata}
-
-            item["updated_at"] = datetime.now().isoformat()
-
-            items[i] = item
-            break
-
-    if not found:
+    item = _get_item(item_id)
+    if item is None:
         raise HTTPException(status_code=404, detail="业务事项不存在")
 
-    _save_items(items)
+    # 没有任何字段需要更新时不写库，也不刷新更新时间
+    if not req.model_dump(exclude_none=True):
+        return BusinessItem(**item)
+
+    now_iso = datetime.now().isoformat()
+
+    # 更新字段
+    if req.title is not None:
+        item["title"] = req.title
+    if req.description is not None:
+        item["description"] = req.description
+    if req.priority is not None:
+        item["priority"] = req.priority.value
+    if req.status is not None:
+        item["status"] = req.status.value
+        # 如果状态变为已完成，记录完成时间
+        if req.status == ItemStatus.COMPLETED and not item.get("completed_at"):
+            item["completed_at"] = now_iso
+    if req.due_date is not None:
+        item["due_date"] = req.due_date
+    if req.assignee is not None:
+        item["assignee"] = req.assignee
+    if req.tags is not None:
+        item["tags"] = req.tags
+    if req.metadata is not None:
+        item["metadata"] = {**item.get("metadata", {}), **req.metadata}
+
+    item["updated_at"] = now_iso
+
+    _save_item(item)
 
     print(f"✅ 更新业务事项: {item['title']}")
 
@@ -179,83 +359,71 @@ async def update_item(item_id: str, req: UpdateBusinessItemRequest):
 @router.delete("/{item_id}")
 async def delete_item(item_id: str):
     """删除业务事项"""
-    items = _load_items()
-
-    # 查找并删除
-    found = False
-    new_items = []
-    for item in items:
-        if item.get("id") == item_id:
-            found = True
-            print(f"🗑️  删除业务事项: {item['title']}")
-        else:
-            new_items.append(item)
-
-    if not found:
+    if not _delete_item(item_id):
         raise HTTPException(status_code=404, detail="业务事项不存在")
 
-    _save_items(new_items)
+    print(f"🗑️  删除业务事项: {item_id}")
 
     return {"success": True, "message": "业务事项已删除"}
 
 
-@router.get("/stats/summary", response_model=BusinessItemStats)
-async def get_stats():
-    """获取业务事项统计"""
-    items = _load_items()
-
-    if not items:
-        return BusinessItemStats(
-            total=0,
-            by_type={},
-            by_status={},
-            by_priority={},
-            high_priority_pending=0,
-            overdue=0
-        )
-
-    # 统计各类型数量
-    by_type = {}
-    for item in items:
-        item_type = item.get("type", "other")
-        by_type[item_type] = by_type.get(item_type, 0) + 1
+# 统计缓存：(数据版本, 各项计数, 未完成事项的截止时间升序列表)
+_stats_cache: Optional[Tuple[Tuple[int, int], dict, List[datetime]]] = None
 
-    # 统计各状态数量
-    by_status = {}
-    for item in items:
-        status = item.get("status", "pending")
-        by_status[status] = by_status.get(status, 0) + 1
+_URGENT_PRIORITIES = frozenset({"high", "urgent"})
+
+
+def _compute_stats(items: List[dict]) -> Tuple[dict, List[datetime]]:
+    """计算与当前时间无关的统计项，以及用于计算逾期数的截止时间列表"""
+    by_type, by_status, by_priority = Counter(), Counter(), Counter()
+    high_priority_pending = 0
+    # 未完成事项的截止时间（无法解析或带时区的跳过，与逐条比较时一致）
+    due_dates = []
 
-    # 统计各优先级数量
-    by_priority = {}
+    # 单次遍历完成全部计数
     for item in items:
+        item_type = item.get("type", "other")
+        status = item.get("status", "pending")
         priority = item.get("priority", "medium")
-        by_priority[priority] = by_priority.get(priority, 0) + 1
-
-    # 高优先级待处理
-    high_priority_pending = len([
-        item for item in items
-        if item.get("priority") in ["high", "urgent"]
-        and item.get("status") == "pending"
-    ])
-
-    # 逾期事项
-    now = datetime.now()
-    overdue = 0
-    for item in items:
-        if item.get("due_date") and item.get("status") != "completed":
+        by_type[item_type] += 1
+        by_status[status] += 1
+        by_priority[priority] += 1
+
+        if status == "pending" and priority in _URGENT_PRIORITIES:
+            high_priority_pending += 1
+
+        due_date = item.get("due_date")
+        if due_date and status != "completed":
             try:
-                due_date = datetime.fromisoformat(item["due_date"])
-                if due_date < now:
-                    overdue += 1
-            except:
-                pass
-
-    return BusinessItemStats(
-        total=len(items),
-        by_type=by_type,
-        by_status=by_status,
-        by_priority=by_priority,
-        high_priority_pending=high_priority_pending,
-        overdue=overdue
-    )
+                due_date = datetime.fromisoformat(due_date)
+            except (TypeError, ValueError):
+                continue
+            if due_date.tzinfo is None:
+                due_dates.append(due_date)
+    due_dates.sort()
+
+    counts = {
+        "total": len(items),
+        "by_type": dict(by_type),
+        "by_status": dict(by_status),
+        "by_priority": dict(by_priority),
+        "high_priority_pending": high_priority_pending
+    }
+    return counts, due_dates
+
+
+@router.get("/stats/summary", response_model=BusinessItemStats)
+async def get_stats():
+    """获取业务事项统计（数据未变化时复用上次的统计结果）"""
+    global _stats_cache
+
+    version = _data_version()
+    if _stats_cache is None or _stats_cache[0] != version:
+        counts, due_dates = _compute_stats(query_items())
+        _stats_cache = (version, counts, due_dates)
+    _, counts, due_dates = _stats_cache
+
+    # 逾期事项：截止时间早于当前时间的数量
+    overdue = bisect.bisect_left(due_dates, datetime.now())
+
+    return BusinessItemStats(**counts, overdue=overdue)
@@ -4,18 +4,53 @@ CEO快记功能的API接口
 提供快速记录、AI自动分类、查询功能
 """
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-import json
+import itertools
 import os
+import sqlite3
+import threading
+import time
+
+import orjson
+from app.core.llm import parse_llm_json
+from app.core.memory_async import add_memory_async
 from app.core.state import get_app_state
 
 router = APIRouter()
 
 # 数据存储路径
 NOTES_DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data")
-NOTES_FILE = os.path.join(NOTES_DATA_DIR, "ceo_notes.json")
+NOTES_DB = os.path.join(NOTES_DATA_DIR, "ceo_notes.db")
+NOTES_FILE = os.path.join(NOTES_DATA_DIR, "ceo_notes.json")  # 旧版JSON存储，首次启动时导入SQLite
+
+# 筛选/排序字段单独成列，完整快记以JSON保存在 json 列
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    id TEXT PRIMARY KEY,
+    category TEXT,
+    user_id TEXT,
+    created_at TEXT,
+    json TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_notes_created ON notes(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_notes_category ON notes(category, created_at);
+CREATE INDEX IF NOT EXISTS idx_notes_user ON notes(user_id, created_at);
+"""
+
+_UPSERT_SQL = "INSERT OR REPLACE INTO notes (id, category, user_id, created_at, json) VALUES (?, ?, ?, ?, ?)"
+
+# 删除产生的空闲页超过该比例时回收（相当于日志存储的定期压缩）
+COMPACT_FREE_RATIO = 0.3
+
+_conn: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+
+# ID序列号：同一纳秒内并发创建也不会重复
+_id_seq = itertools.count()
+_id_lock = threading.Lock()
 
 
 class CreateNoteRequest(BaseModel):
@@ -34,26 +69,112 @@ class NoteResponse(BaseModel):
     ai_summary: Optional[str] = None  # AI生成的摘要
 
 
-def _load_notes() -> List[Dict]:
-    """加载快记数据"""
+_NOTES_ADAPTER = TypeAdapter(List[NoteResponse])
+
+
+def _new_id(prefix: str) -> str:
+    """生成唯一ID：纳秒时间戳 + 进程内递增序号"""
+    with _id_lock:
+        seq = next(_id_seq)
+    return f"{prefix}_{time.time_ns()}_{seq:06x}"
+
+
+def _get_conn() -> sqlite3.Connection:
+    """获取SQLite连接（首次调用时建表，并导入旧版JSON数据）"""
+    global _conn
+    if _conn is None:
+        with _db_lock:
+            if _conn is None:
+                os.makedirs(NOTES_DATA_DIR, exist_ok=True)
+                conn = sqlite3.connect(NOTES_DB, check_same_thread=False)
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")  # 仅对新建的数据库生效
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.executescript(_SCHEMA)
+                _import_legacy_notes(conn)
+                _conn = conn
+    return _conn
+
+
+def _import_legacy_notes(conn: sqlite3.Connection):
+    """数据库为空且存在旧版JSON文件时，一次性导入"""
     if not os.path.exists(NOTES_FILE):
-        return []
+        return
+    if conn.execute("SELECT 1 FROM notes LIMIT 1").fetchone():
+        return
+
+    try:
+        with open(NOTES_FILE, "rb") as f:
+            notes = orjson.loads(f.read())
+        with conn:
+            conn.executemany(_UPSERT_SQL, [_note_row(note) for note in notes])
+        print(f"✅ 已从JSON导入 {len(notes)} 条快记")
+    except Exception as e:
+        print(f"⚠️  导入旧版快记失败: {e}")
+
+
+def _note_row(note: Dict) -> tuple:
+    """快记字典 -> notes 表的一行"""
+    return (
+        note["id"],
+        note.get("category"),
+        note.get("user_id"),
+        note.get("created_at"),
+        orjson.dumps(note).decode()
+    )
+
+
+def _query_notes(
+    category: Optional[str] = None,
+    user_id: Optional[str] = None,
+    limit: Optional[int] = None
+) -> List[Dict]:
+    """按条件查询快记（按时间倒序），筛选、排序和数量限制都在SQLite中完成"""
+    clauses = []
+    params: list = []
+    for column, value in (("category", category), ("user_id", user_id)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+
+    sql = "SELECT json FROM notes"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += " ORDER BY created_at DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
 
     try:
-        with open(NOTES_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        conn = _get_conn()
+        with _db_lock:
+            rows = conn.execute(sql, params).fetchall()
+        return [orjson.loads(row[0]) for row in rows]
     except Exception as e:
         print(f"⚠️  加载快记失败: {e}")
         return []
 
 
-def _save_notes(notes: List[Dict]):
-    """保存快记数据"""
-    os.makedirs(NOTES_DATA_DIR, exist_ok=True)
+def _data_version() -> Tuple[int, int]:
+    """数据版本：本连接的累计修改行数 + 其他连接的提交计数，任一变化即说明数据已变"""
+    conn = _get_conn()
+    with _db_lock:
+        return conn.total_changes, conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _maybe_compact(conn: sqlite3.Connection):
+    """空闲页占比过高时增量回收磁盘空间（调用方需持有 _db_lock）"""
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if free_pages and free_pages > COMPACT_FREE_RATIO * conn.execute("PRAGMA page_count").fetchone()[0]:
+        conn.execute("PRAGMA incremental_vacuum")
 
+
+def _save_note(note: Dict):
+    """保存单条快记"""
     try:
-        with open(NOTES_FILE, "w", encoding="utf-8") as f:
-            json.dump(notes, f, ensure_ascii=False, indent=2)
+        conn = _get_conn()
+        with _db_lock, conn:
+            conn.execute(_UPSERT_SQL, _note_row(note))
     except Exception as e:
         print(f"⚠️  保存快记失败: {e}")
         raise HTTPException(status_code=500, detail=f"保存快记失败: {str(e)}")
@@ -95,6 +216,7 @@ async def _classify_note_with_ai(content: str) -> tuple[str, str]:
     try:
         # 调用LLM
         messages = [{"role": "user", "content": prompt}]
+        # 不走语义缓存：摘要针对每条快记生成，相近的快记（如只差时间）不能复用
         response = await app_state.llm_client.async_chat_completion(
             messages=messages,
             temperature=0.3,
@@ -105,16 +227,8 @@ async def _classify_note_with_ai(content: str) -> tuple[str, str]:
             print(f"⚠️  AI分类失败: {response['error']}")
             return "other", content[:50] + "..." if len(content) > 50 else content
 
-        # 解析LLM响应
-        content_text = response.get("content", "")
-
-        # 提取JSON（处理可能的markdown代码块）
-        if "```json" in content_text:
-            content_text = content_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in content_text:
-            content_text = content_text.split("```")[1].split("```")[0].strip()
-
-        result = json.loads(content_text)
+        # 解析LLM响应（处理可能的markdown代码块）
+        result = parse_llm_json(response.get("content") or "")
         category = result.get("category", "other")
         summary = result.get("summary", content[:50] + "...")
 
@@ -136,7 +250,7 @@ async def create_note(req: CreateNoteRequest):
     创建CEO快记
 
     - 使用AI自动分类
-    - 保存到JSON文件
+    - 保存到SQLite
     - 保存到企业级记忆（Mem0）
     """
     app_state = get_app_state()
@@ -147,7 +261,7 @@ async def create_note(req: CreateNoteRequest):
     print(f"   分类: {category}, 摘要: {summary}")
 
     # 2. 生成快记ID
-    note_id = f"note_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{req.user_id}"
+    note_id = f"{_new_id('note')}_{req.user_id}"
 
     # 3. 创建快记对象
     note = {
@@ -159,16 +273,15 @@ async def create_note(req: CreateNoteRequest):
         "user_id": req.user_id
     }
 
-    # 4. 保存到JSON文件
-    notes = _load_notes()
-    notes.append(note)
-    _save_notes(notes)
+    # 4. 保存到SQLite
+    _save_note(note)
 
     # 5. 保存到企业级记忆（Mem0）
     if app_state.memory_manager:
         try:
             memory_content = f"[CEO快记-{category}] {req.content}"
-            app_state.memory_manager.add_memory(
+            result = await add_memory_async(
+                app_state.memory_manager,
                 content=memory_content,
                 memory_type="global",
                 source="ceo_notes",
@@ -183,7 +296,10 @@ async def create_note(req: CreateNoteRequest):
                 },
                 user_id="system"
             )
-            print(f"   ✅ 已保存到企业记忆")
+            if result.get("success"):
+                print(f"   ✅ 已保存到企业记忆")
+            else:
+                print(f"   ⚠️  保存到Mem0失败: {result.get('error')}")
         except Exception as e:
             print(f"   ⚠️  保存到Mem0失败: {e}")
 
@@ -203,59 +319,55 @@ async def list_notes(
     - 支持按用户筛选
     - 默认返回最近50条
     """
-    notes = _load_notes()
-
-    # 过滤
-    if category:
-        notes = [n for n in notes if n.get("category") == category]
-
-    if user_id:
-        notes = [n for n in notes if n.get("user_id") == user_id]
+    # 过滤、按时间倒序、限制数量
+    notes = _query_notes(category=category, user_id=user_id, limit=limit)
 
-    # 按时间倒序
-    notes.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-
-    # 限制数量
-    notes = notes[:limit]
-
-    return [NoteResponse(**note) for note in notes]
+    # 整个列表一次校验、一次序列化；直接返回Response，FastAPI不再按response_model重复校验
+    return Response(
+        content=_NOTES_ADAPTER.dump_json(_NOTES_ADAPTER.validate_python(notes)),
+        media_type="application/json"
+    )
 
 
 @router.get("/{note_id}", response_model=NoteResponse)
 async def get_note(note_id: str):
     """获取单条快记"""
-    notes = _load_notes()
+    conn = _get_conn()
+    with _db_lock:
+        row = conn.execute("SELECT json FROM notes WHERE id = ?", (note_id,)).fetchone()
 
-    for note in notes:
-        if note.get("id") == note_id:
-            return NoteResponse(**note)
+    if row is None:
+        raise HTTPException(status_code=404, detail="快记不存在")
 
-    raise HTTPException(status_code=404, detail="快记不存在")
+    return NoteResponse(**orjson.loads(row[0]))
 
 
 @router.delete("/{note_id}")
 async def delete_note(note_id: str):
     """删除快记"""
-    notes = _load_notes()
-
-    # 查找并删除
-    found = False
-    new_notes = []
-    for note in notes:
-        if note.get("id") == note_id:
-            found = True
-            print(f"🗑️  删除快记: {note_id}")
-        else:
-            new_notes.append(note)
-
-    if not found:
+    try:
+        conn = _get_conn()
+        with _db_lock, conn:
+            cursor = conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+        if cursor.rowcount:
+            with _db_lock:
+                _maybe_compact(conn)
+    except Exception as e:
+        print(f"⚠️  删除快记失败: {e}")
+        raise HTTPException(status_code=500, detail=f"删除快记失败: {str(e)}")
+
+    if cursor.rowcount == 0:
         raise HTTPException(status_code=404, detail="快记不存在")
 
-    _save_notes(new_notes)
+    print(f"🗑️  删除快记: {note_id}")
 
     return {"success": True, "message": "快记已删除"}
 
 
+# 统计缓存：(数据版本, 统计结果)
+_stats_cache: Optional[Tuple[Tuple[int, int], Dict]] = None
+
+
 @router.get("/stats/summary")
 async def get_notes_stats():
     """
@@ -264,28 +376,27 @@ async def get_notes_stats():
     - 总数
     - 各分类数量
     - 最近记录时间
+
+    数据未变化时直接返回上次的统计结果
     """
-    notes = _load_notes()
-
-    if not notes:
-        return {
-            "total": 0,
-            "by_category": {},
-            "last_note_time": None
-        }
-
-    # 统计各分类数量
-    category_counts = {}
-    for note in notes:
-        category = note.get("category", "other")
-        category_counts[category] = category_counts.get(category, 0) + 1
-
-    # 最近记录时间
-    notes.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    last_note_time = notes[0].get("created_at") if notes else None
-
-    return {
-        "total": len(notes),
+    global _stats_cache
+
+    version = _data_version()
+    if _stats_cache is not None and _stats_cache[0] == version:
+        return _stats_cache[1]
+
+    # 计数和最近时间直接由SQLite聚合，不必取出并解析每条快记
+    conn = _get_conn()
+    with _db_lock:
+        rows = conn.execute(
+            "SELECT COALESCE(category, 'other'), COUNT(*), MAX(created_at) FROM notes GROUP BY 1"
+        ).fetchall()
+
+    category_counts = {category: count for category, count, _ in rows}
+    stats = {
+        "total": sum(category_counts.values()),
         "by_category": category_counts,
-        "last_note_time": last_note_time
+        "last_note_time": max((last for _, _, last in rows if last), default=None)
     }
+    _stats_cache = (version, stats)
+    return stats
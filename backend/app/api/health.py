@@ -3,22 +3,30 @@ Health Check API
 健康检查接口
 """
 from fastapi import APIRouter
+from fastapi.responses import Response
 from datetime import datetime
 
+import orjson
+
 router = APIRouter()
 
+# 探活接口调用最频繁：固定内容预先序列化，直接返回bytes，跳过响应模型校验和JSON编码
+_HEALTH_PREFIX = b'{"status":"healthy","timestamp":'
+_HEALTH_SUFFIX = b',"service":"EAIOS Backend"}'
+_PONG_PAYLOAD = orjson.dumps({"message": "pong"})
+
 
 @router.get("/health")
 async def health_check():
     """健康检查"""
-    return {
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
-        "service": "EAIOS Backend"
-    }
+    # orjson 直接输出与 isoformat() 相同格式的时间字符串
+    return Response(
+        content=_HEALTH_PREFIX + orjson.dumps(datetime.now()) + _HEALTH_SUFFIX,
+        media_type="application/json"
+    )
 
 
 @router.get("/ping")
 async def ping():
     """Ping测试"""
-    return {"message": "pong"}
+    return Response(content=_PONG_PAYLOAD, media_type="application/json")
@@ -3,11 +3,18 @@ Memory Management API
 记忆管理接口
 """
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional, List
+import asyncio
+from app.core.memory_async import (
+    MEMORY_ADMIN_READ_TIMEOUT, add_memory_async, delete_memory_async, get_all_memories_async,
+    search_memories_async, toggle_memory_async
+)
 from app.core.state import get_app_state
 
-router = APIRouter()
+# 记忆列表/搜索结果体积较大，统一用orjson序列化
+router = APIRouter(default_response_class=ORJSONResponse)
 
 
 class AddMemoryRequest(BaseModel):
@@ -44,7 +51,8 @@ async def add_memory(request: AddMemoryRequest):
     if not memory_mgr:
         raise HTTPException(status_code=500, detail="记忆管理器未初始化")
 
-    result = memory_mgr.add_memory(
+    result = await add_memory_async(
+        memory_mgr,
         content=request.content,
         memory_type=request.memory_type,
         source=request.source,
@@ -69,7 +77,8 @@ async def toggle_memory(request: ToggleMemoryRequest):
     if not memory_mgr:
         raise HTTPException(status_code=500, detail="记忆管理器未初始化")
 
-    result = memory_mgr.toggle_memory(
+    result = await toggle_memory_async(
+        memory_mgr,
         memory_id=request.memory_id,
         enabled=request.enabled
     )
@@ -92,7 +101,16 @@ async def list_memories(memory_type: Optional[str] = None):
     if not memory_mgr:
         raise HTTPException(status_code=500, detail="记忆管理器未初始化")
 
-    memories = memory_mgr.get_all_memories(memory_type=memory_type)
+    # 管理页面展示的是完整记忆库：超时返回504，而不是空列表（会被误认为记忆库为空）
+    try:
+        memories = await get_all_memories_async(
+            memory_mgr,
+            timeout=MEMORY_ADMIN_READ_TIMEOUT,
+            degrade=False,
+            memory_type=memory_type
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="获取记忆超时，请稍后重试")
 
     return {
         "success": True,
@@ -113,12 +131,18 @@ async def search_memories(request: SearchMemoryRequest):
     if not memory_mgr:
         raise HTTPException(status_code=500, detail="记忆管理器未初始化")
 
-    memories = memory_mgr.search_memories(
-        query=request.query,
-        memory_type=request.memory_type,
-        enabled_only=request.enabled_only,
-        limit=request.limit
-    )
+    try:
+        memories = await search_memories_async(
+            memory_mgr,
+            timeout=MEMORY_ADMIN_READ_TIMEOUT,
+            degrade=False,
+            query=request.query,
+            memory_type=request.memory_type,
+            enabled_only=request.enabled_only,
+            limit=request.limit
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="搜索记忆超时，请稍后重试")
 
     return {
         "success": True,
@@ -139,7 +163,7 @@ async def delete_memory(memory_id: str):
     if not memory_mgr:
         raise HTTPException(status_code=500, detail="记忆管理器未初始化")
 
-    result = memory_mgr.delete_memory(memory_id=memory_id)
+    result = await delete_memory_async(memory_mgr, memory_id=memory_id)
 
     if not result.get("success"):
         raise HTTPException(status_code=500, detail=result.get("error"))
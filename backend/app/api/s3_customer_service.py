@@ -7,20 +7,59 @@ S3 Customer Service API
 from __future__ import annotations
 
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional
-import json
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import hashlib
+import os
+import threading
+import time
+import itertools
+import logging
 from datetime import datetime
 import random
 
+import orjson
+
 from app.core.state import get_app_state
 from app.core.customer_service_kb import get_cs_kb
+from app.core.memory_async import embed_query_async
+from app.core.response_cache import SemanticResponseCache
+from app.core.sse import SSE_DONE, event_stream_response, sse_content, sse_event
 from app.core.data_analyzer import get_data_analyzer
 
+logger = logging.getLogger(__name__)
+
 
 router = APIRouter()
 
+# 系统提示词缓存：同一客户短时间内重复提问时，跳过知识库检索和提示词拼装
+PROMPT_CACHE_TTL = 30.0
+PROMPT_CACHE_SIZE = 256
+_prompt_cache: "OrderedDict[tuple, Tuple[float, str]]" = OrderedDict()
+
+# 客服回复缓存：同一客户重复或语义相近的问题直接回放，跳过LLM调用
+# 作用域包含客户ID、知识库版本和对话历史，知识库更新后旧回复自然失效
+_response_cache = SemanticResponseCache(capacity=1024, ttl=3600.0, threshold=0.92)
+
+# 对话历史超过该条数时不走回复缓存（长对话几乎不会重复，且回复更依赖上下文）
+RESPONSE_CACHE_MAX_HISTORY = 6
+
+# 缓存回放时每个SSE content事件的字符数
+_CACHED_REPLY_CHUNK_SIZE = 32
+
+# 读取客户要点的超时（秒）：Mem0偶尔很慢，超时直接不带要点继续对话
+RECENT_POINTS_TIMEOUT = 0.8
+# 客户要点查询使用独立的小线程池：超时后线程仍会跑完，放在默认线程池里会占满
+# 知识库检索、向量计算、metrics读写共用的线程；线程全部被占用时直接跳过查询
+RECENT_POINTS_WORKERS = int(os.getenv("S3_RECENT_POINTS_WORKERS", "4"))
+_points_executor = ThreadPoolExecutor(max_workers=RECENT_POINTS_WORKERS, thread_name_prefix="s3-points")
+# 正在执行（包括已超时但线程尚未结束）的查询数
+_points_slots = threading.BoundedSemaphore(RECENT_POINTS_WORKERS)
+
 
 class ChatRequest(BaseModel):
     customer_id: str
@@ -34,43 +73,90 @@ class KBAddRequest(BaseModel):
     content: str
 
 
-def _s3_system_prompt(kb_snippets: List[Dict], recent_points: List[str]) -> str:
-    kb_text = "\n".join([f"- {k.get('title')}: {k.get('content')[:200]}" for k in kb_snippets]) or "无"
+_S3_PROMPT_TMPL = (
+    "你是企业的智能客服。目标：准确、简洁，先解决问题；缺信息时礼貌引导。\n"
+    "规则：\n"
+    "1) 回答需基于知识库（若命中）并在结尾附'依据：<条目名>'。\n"
+    "2) 若识别到客户历史要点（未结项/到期项），先提醒并衔接上下文。\n"
+    "3) 订单进度/投诉可调用工具，由系统处理；无法获取时要说明并引导补充信息。\n"
+    "知识库片段：\n{kb_text}\n"
+    "该客户最近要点：\n{points_text}\n"
+    "回答使用中文，避免过长。"
+)
+
+
+@functools.lru_cache(maxsize=512)
+def _render_s3_prompt(kb_items: Tuple[Tuple[str, str], ...], recent_points: Tuple[str, ...]) -> str:
+    kb_text = "\n".join([f"- {title}: {content[:200]}" for title, content in kb_items]) or "无"
     points_text = "\n".join([f"- {p}" for p in recent_points]) or "无"
-    return (
-        "你是企业的智能客服。目标：准确、简洁，先解决问题；缺信息时礼貌引导。\n"
-        "规则：\n"
-        "1) 回答需基于知识库（若命中）并在结尾附'依据：<条目名>'。\n"
-        "2) 若识别到客户历史要点（未结项/到期项），先提醒并衔接上下文。\n"
-        "3) 订单进度/投诉可调用工具，由系统处理；无法获取时要说明并引导补充信息。\n"
-        f"知识库片段：\n{kb_text}\n"
-        f"该客户最近要点：\n{points_text}\n"
-        "回答使用中文，避免过长。"
+    return _S3_PROMPT_TMPL.format(kb_text=kb_text, points_text=points_text)
+
+
+def _s3_system_prompt(kb_snippets: List[Dict], recent_points: List[str]) -> str:
+    # 命中的知识库条目和客户要点相同时，直接复用已渲染的提示词
+    return _render_s3_prompt(
+        tuple((k.get("title"), k.get("content")) for k in kb_snippets),
+        tuple(recent_points)
     )
 
 
+def _get_cached_prompt(key: tuple) -> Optional[str]:
+    entry = _prompt_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, prompt = entry
+    if expires_at < time.monotonic():
+        del _prompt_cache[key]
+        return None
+    return prompt
+
+
+def _put_cached_prompt(key: tuple, prompt: str):
+    _prompt_cache[key] = (time.monotonic() + PROMPT_CACHE_TTL, prompt)
+    _prompt_cache.move_to_end(key)
+    while len(_prompt_cache) > PROMPT_CACHE_SIZE:
+        _prompt_cache.popitem(last=False)
+
+
+def _response_scope(customer_id: str, kb_version: int, conversation_history: Optional[List[Dict]]) -> str:
+    """回复缓存作用域：客户 + 知识库版本 + 对话历史摘要"""
+    digest = hashlib.sha256(f"{customer_id}\x00{kb_version}\x00".encode("utf-8"))
+    if conversation_history:
+        digest.update(orjson.dumps(conversation_history, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS))
+    return digest.hexdigest()
+
+
 def _format_point(now: datetime, topic: str, key_info: str, resolved: bool) -> str:
     flag = "是" if resolved else "转人工/未结"
     return f"{now.strftime('%Y-%m-%d %H:%M')}｜{topic}｜{key_info}｜{flag}"
 
 
+# 模拟metrics（实际应该从数据库统计）：启动时预先生成一批，上报时循环取用
+_FAKE_METRICS = tuple(
+    {
+        "total_consultations": random.randint(100, 200),
+        "satisfaction_rate": round(random.uniform(0.75, 0.95), 2),
+        "complaint_rate": round(random.uniform(0.02, 0.15), 2),
+        "avg_response_time": round(random.uniform(30, 120), 1)
+    }
+    for _ in range(256)
+)
+_fake_metrics_iter = itertools.cycle(_FAKE_METRICS)
+
+
 def _report_metrics_to_s6():
     """
     上报S3客服metrics到S6数据分析
 
     模拟计算当前客服指标
     实际应用中应该从数据库或缓存中获取真实数据
+    涉及文件读写，由调用方放到线程中执行
     """
     try:
         analyzer = get_data_analyzer()
 
-        # 模拟metrics（实际应该从数据库统计）
-        metrics = {
-            "total_consultations": random.randint(100, 200),
-            "satisfaction_rate": round(random.uniform(0.75, 0.95), 2),
-            "complaint_rate": round(random.uniform(0.02, 0.15), 2),
-            "avg_response_time": round(random.uniform(30, 120), 1)
-        }
+        # collect_metrics 会写入时间戳，传入副本
+        metrics = dict(next(_fake_metrics_iter))
 
         analyzer.collect_metrics("s3_customer_service", metrics)
         print(f"✅ S3上报metrics到S6: {metrics}")
@@ -79,6 +165,51 @@ def _report_metrics_to_s6():
         print(f"⚠️  S3上报metrics失败: {e}")
 
 
+def _release_points_slot(future: asyncio.Future):
+    """查询线程结束后归还名额（并取走结果，避免未读取异常的告警）"""
+    _points_slots.release()
+    if not future.cancelled():
+        future.exception()
+
+
+async def _fetch_recent_points(app_state, customer_id: str) -> List[str]:
+    """
+    读取最近3条客户要点（customer_service 域）
+
+    在独立线程池中执行；线程池繁忙、Mem0超时或出错时返回空列表，不拖慢对话
+    """
+    if not _points_slots.acquire(blocking=False):
+        print("⚠️ S3客户要点查询繁忙，本次跳过")
+        return []
+    try:
+        future = asyncio.get_running_loop().run_in_executor(
+            _points_executor,
+            functools.partial(
+                app_state.memory_manager.search_memories,
+                query=customer_id,
+                level="scenario",
+                domain="customer_service",
+                scope={"customerId": customer_id},
+                limit=3
+            )
+        )
+    except Exception:
+        _points_slots.release()
+        raise
+    # 名额在线程真正结束时归还，而不是在超时时
+    future.add_done_callback(_release_points_slot)
+
+    try:
+        recent = await asyncio.wait_for(asyncio.shield(future), RECENT_POINTS_TIMEOUT)
+        return [m.content for m in recent]
+    except asyncio.TimeoutError:
+        print(f"⚠️ S3读取客户历史要点超时（{RECENT_POINTS_TIMEOUT}s），不带要点继续")
+        return []
+    except Exception as e:
+        print(f"⚠️ S3读取客户历史要点失败: {e}")
+        return []
+
+
 @router.post("/chat/stream")
 async def chat_stream(req: ChatRequest):
     app_state = get_app_state()
@@ -88,30 +219,38 @@ async def chat_stream(req: ChatRequest):
     if not req.customer_id or not req.message:
         raise HTTPException(status_code=400, detail="缺少customer_id或message")
 
-    kb = get_cs_kb()
-    # 简单检索：按用户问题找3条kb
-    kb_hits = kb.search(req.message, top_k=3)
-
-    # 读取最近3条客户要点（customer_service 域）
-    # 🔧 临时禁用Mem0搜索，避免超时阻塞
     print(f"📝 S3处理客户 {req.customer_id} 的消息: {req.message[:50]}")
-    recent_points = []
 
-    # TODO: 等Mem0稳定后再启用
-    # try:
-    #     recent = app_state.memory_manager.search_memories(
-    #         query=req.customer_id,
-    #         level="scenario",
-    #         domain="customer_service",
-    #         scope={"customerId": req.customer_id},
-    #         limit=3
-    #     )
-    #     recent_points = [m.content for m in recent]
-    # except Exception as e:
-    #     print(f"⚠️ S3读取客户历史要点失败: {e}")
-    #     recent_points = []
-
-    system_prompt = _s3_system_prompt(kb_hits, recent_points)
+    kb = get_cs_kb()
+    # 知识库有更新时 version 变化，旧的缓存条目自然失效
+    prompt_key = (
+        req.customer_id,
+        kb.version,
+        hashlib.blake2b(req.message.encode(), digest_size=8).digest()
+    )
+    system_prompt = _get_cached_prompt(prompt_key)
+
+    use_cache = len(req.conversation_history or []) <= RESPONSE_CACHE_MAX_HISTORY
+    if use_cache:
+        cache_scope = _response_scope(req.customer_id, kb.version, req.conversation_history)
+        cache_key = SemanticResponseCache.make_key("s3_chat_stream", req.message, cache_scope)
+        # 回复缓存要用的查询向量与下面的检索互不依赖，先在线程中开始计算
+        query_emb_task = asyncio.ensure_future(
+            embed_query_async(app_state.memory_manager, req.message)
+        )
+
+    if system_prompt is None:
+        # 客户要点读取先在后台线程启动；知识库检索（倒排索引，微秒级）留在事件循环中执行，
+        # 不与 add_entry/reload 对索引的修改并发
+        points_task = asyncio.ensure_future(_fetch_recent_points(app_state, req.customer_id))
+        try:
+            kb_hits = kb.search(req.message, top_k=3)
+        except BaseException:
+            points_task.cancel()
+            raise
+        recent_points = await points_task
+        system_prompt = _s3_system_prompt(kb_hits, recent_points)
+        _put_cached_prompt(prompt_key, system_prompt)
 
     messages: List[Dict] = [{"role": "system", "content": system_prompt}]
     if req.conversation_history:
@@ -119,11 +258,27 @@ async def chat_stream(req: ChatRequest):
     messages.append({"role": "user", "content": req.message})
 
     async def generate_stream():
-        full_reply = ""
+        reply_len = 0
         try:
+            # 回复缓存：命中则直接回放
+            if use_cache:
+                query_emb = await query_emb_task
+                cached_reply = _response_cache.get(cache_key, query_emb, cache_scope)
+                if cached_reply is not None:
+                    print("⚡ 命中回复缓存，跳过LLM调用")
+                    for i in range(0, len(cached_reply), _CACHED_REPLY_CHUNK_SIZE):
+                        yield sse_content(cached_reply[i:i + _CACHED_REPLY_CHUNK_SIZE])
+                        # 回放是纯同步循环，每段后让出事件循环，避免独占其他会话的调度
+                        await asyncio.sleep(0)
+                    yield SSE_DONE
+                    await asyncio.to_thread(_report_metrics_to_s6)
+                    return
+
             print(f"🚀 开始调用LLM，消息数: {len(messages)}")
+            reply_parts: List[str] = []
 
             chunk_count = 0
+            finished = False
             async for chunk in app_state.llm_client.async_chat_completion_stream(messages):
                 chunk_count += 1
                 t = chunk.get("type")
@@ -133,34 +288,41 @@ async def chat_stream(req: ChatRequest):
 
                 if t == "content":
                     c = chunk.get("content", "")
-                    full_reply += c
-                    yield f"data: {json.dumps({'type': 'content', 'content': c}, ensure_ascii=False)}\n\n"
+                    reply_len += len(c)
+                    reply_parts.append(c)
+                    yield sse_content(c)
+                    # 让出事件循环：每个chunk立即下发，其他协程也能得到调度
+                    await asyncio.sleep(0)
                 elif t == "done":
-                    print(f"✅ LLM生成完成: chunk_count={chunk_count}, reply_len={len(full_reply)}")
-                    # 对话结束，上报metrics到S6
-                    _report_metrics_to_s6()
+                    print(f"✅ LLM生成完成: chunk_count={chunk_count}, reply_len={reply_len}")
+                    finished = True
                     break
                 elif t == "error":
                     error_msg = chunk.get("error", "未知错误")
                     print(f"❌ LLM错误: {error_msg}")
-                    yield f"data: {json.dumps({'type': 'error', 'error': error_msg}, ensure_ascii=False)}\n\n"
+                    yield sse_event({'type': 'error', 'error': error_msg})
                     return
 
             if chunk_count == 0:
                 print(f"⚠️ 警告：LLM没有返回任何chunk")
-                yield f"data: {json.dumps({'type': 'error', 'error': 'LLM没有返回内容'}, ensure_ascii=False)}\n\n"
+                yield sse_event({'type': 'error', 'error': 'LLM没有返回内容'})
                 return
 
-            yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
-            print(f"✅ S3对话完成，回复长度: {len(full_reply)}")
+            yield SSE_DONE
+            print(f"✅ S3对话完成，回复长度: {reply_len}")
+
+            # 对话结束，上报metrics到S6（完成事件已发出，文件读写放到线程中，不占用事件循环）
+            if finished:
+                await asyncio.to_thread(_report_metrics_to_s6)
+
+            if use_cache and reply_parts:
+                _response_cache.put(cache_key, "".join(reply_parts), query_emb, cache_scope)
 
         except Exception as e:
-            import traceback
-            error_detail = traceback.format_exc()
-            print(f"❌ S3对话异常: {error_detail}")
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
+            logger.exception("❌ S3对话异常")
+            yield sse_event({'type': 'error', 'error': str(e)})
 
-    return StreamingResponse(generate_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "Connection": "keep-alive", "X-Accel-Buffering": "no"})
+    return event_stream_response(generate_stream())
 
 
 @router.post("/kb/add")
@@ -216,21 +378,19 @@ async def clear_customer_data(customer_id: str):
     if not app_state.memory_manager:
         raise HTTPException(status_code=500, detail="系统未初始化")
     
-    # 查找该客户所有customer_service域的记忆并删除
-    results = app_state.memory_manager.search_memories(
-        query=customer_id,
-        memory_type=None,
-        limit=100,
-        enabled_only=True,
-        user_id="system"
-    )
-    deleted_count = 0
-    for m in results:
-        md = m.metadata or {}
-        if md.get("domain") == "customer_service" and md.get("scope", {}).get("customerId") == customer_id:
-            app_state.memory_manager.delete_memory(m.id, user_id="system")
-            deleted_count += 1
-    
+    # 按域和客户ID直接在向量库中列出该客户的全部记忆（含已停用的），再一次批量删除；
+    # 两步都是同步的Mem0调用，放到线程中执行，避免阻塞事件循环
+    def _clear() -> int:
+        manager = app_state.memory_manager
+        ids = manager.find_memory_ids(
+            user_id="system",
+            domain="customer_service",
+            scope={"customerId": customer_id}
+        )
+        return manager.delete_memories(ids, "system")
+
+    deleted_count = await asyncio.to_thread(_clear)
+
     return {"success": True, "deleted_count": deleted_count}
 
 
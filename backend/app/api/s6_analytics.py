@@ -5,6 +5,7 @@ S6数据分析场景API - 企业数据中台
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import Dict, Optional, List
+import asyncio
 from app.core.data_analyzer import get_data_analyzer
 
 router = APIRouter()
@@ -45,7 +46,8 @@ async def get_latest_report():
     analyzer = get_data_analyzer()
 
     try:
-        report = analyzer.get_latest_report()
+        # 报告过期时会重新分析并写文件，放到线程中执行
+        report = await asyncio.to_thread(analyzer.get_latest_report)
         return report
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -62,7 +64,7 @@ async def get_scenario_report(scenario: str):
     analyzer = get_data_analyzer()
 
     try:
-        summary = analyzer.get_scenario_summary(scenario)
+        summary = await asyncio.to_thread(analyzer.get_scenario_summary, scenario)
         return summary
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -78,7 +80,7 @@ async def trigger_analysis():
     analyzer = get_data_analyzer()
 
     try:
-        report = analyzer.analyze_all_scenarios()
+        report = await asyncio.to_thread(analyzer.analyze_all_scenarios)
         return {
             "success": True,
             "report_id": report["report_id"],
@@ -98,7 +100,7 @@ async def get_insights():
     analyzer = get_data_analyzer()
 
     try:
-        report = analyzer.get_latest_report()
+        report = await asyncio.to_thread(analyzer.get_latest_report)
         return {
             "insights": report.get("insights", []),
             "generated_at": report.get("generated_at")
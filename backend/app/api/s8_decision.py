@@ -3,140 +3,252 @@ S8 Decision API
 S8决策军师场景的API接口
 """
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Dict, List, Optional
-from datetime import datetime
-import json
 import asyncio
+import hashlib
+import logging
+import os
+import re
+import orjson
 from app.core.state import get_app_state
+from app.core.memory_async import embed_query_async, search_memories_async
+from app.core.response_cache import SemanticResponseCache
+from app.core.sse import SSE_DONE, event_stream_response, sse_content, sse_event
+from app.core.memory_writer import get_memory_writer
 from app.scenarios.s8_decision import S8DecisionAgent
 from app.core.meeting_assistant import get_meeting_assistant
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# 记忆保存关键词（决策 / 数据 / 行动），预编译为单个正则，一次扫描完成匹配
+_DECISION_KEYWORDS = ["决定", "决策", "计划", "策略", "方案", "建议", "应该", "需要", "必须"]
+_DATA_KEYWORDS = ["数据", "指标", "百分比", "%", "增长", "下降", "风险", "目标"]
+_ACTION_KEYWORDS = ["执行", "安排", "负责", "完成", "截止", "任务", "行动"]
+_SAVE_KEYWORDS_RE = re.compile(
+    "|".join(map(re.escape, _DECISION_KEYWORDS + _DATA_KEYWORDS + _ACTION_KEYWORDS))
+)
+_GREETING_RE = re.compile("|".join(map(re.escape, ["你好", "您好", "hi", "hello", "早上好", "晚上好"])))
+
+# S8对话回复缓存（相同或语义相近的问题直接复用回复，跳过LLM调用）
+_response_cache = SemanticResponseCache(capacity=1024, ttl=300.0, threshold=0.92)
+
+# 缓存回放时每个SSE content事件的字符数
+_CACHED_REPLY_CHUNK_SIZE = 32
+
+# 流式输出合并：缓冲文本达到该字符数或距上次发送超过该间隔（秒）时发送一帧
+_SSE_FLUSH_CHARS = 64
+_SSE_FLUSH_INTERVAL = 0.02
+
+# 非流式对话的LLM超时（秒）；超时后缩短回复长度重试一次
+LLM_CHAT_TIMEOUT = float(os.getenv("LLM_CHAT_TIMEOUT", "30.0"))
+LLM_CHAT_RETRY_MAX_TOKENS = int(os.getenv("LLM_CHAT_RETRY_MAX_TOKENS", "800"))
+
+# 发送给LLM的对话历史上限（只保留最近的消息，控制每次请求的token数）
+MAX_HISTORY_MESSAGES = 20
+MAX_HISTORY_CHARS = 8000
+
+# S8系统提示词：静态指令在前、动态的企业信息在后，
+# 保证每轮请求的提示词前缀字节一致，便于LLM服务端的前缀缓存命中
+_S8_ROLE_PROMPT = "你是S8决策军师，一个帮助CEO做决策的AI助手。"
+
+_S8_TOOL_RULES_PROMPT = """你可以使用飞书任务工具来帮助CEO安排任务。
+
+**工具使用规则：**
+
+1. **单个任务创建**：
+   - 工具名称：anpaitask
+   - 参数说明：
+     * taskname: 任务名称（从建议中提取）
+     * openid: 测试员工ID固定为 ou_891645e9faf220921f1f54c2866a8298
+     * starttime: 任务开始时间（ISO 8601格式，默认今天）
+     * duetime: 任务截止时间（ISO 8601格式，根据紧急程度推断：紧急=3天后，一般=7天后）
+
+2. **批量任务创建流程（多轮调用）**：
+   当CEO说"是，请帮我安排这些任务"或类似确认语句时：
+
+   步骤1：回顾之前生成的报告，找出所有行动建议（通常有3-5个）
+
+   步骤2：逐个创建任务（支持多轮调用）
+   - 调用anpaitask创建第1个任务
+   - 看到第1个任务创建成功后，继续调用anpaitask创建第2个任务
+   - 看到第2个任务创建成功后，继续调用anpaitask创建第3个任务
+   - ...以此类推，直到所有任务创建完成
+   - **提示**：系统支持多轮工具调用，每次工具执行后你都可以继续调用下一个
+
+   步骤3：所有任务创建完成后，用自然语言总结已创建的任务清单
+
+3. **缺失信息处理**：
+   - 负责人（openid）：默认使用测试员工ID ou_891645e9faf220921f1f54c2866a8298
+   - 截止时间（duetime）：如果报告中有明确时间（如"11月5日前"），使用该时间；否则根据紧急程度推断
+   - 开始时间（starttime）：默认今天
+
+4. **重要提醒**：
+   - 一次anpaitask调用只能创建一个任务
+   - 系统支持多轮工具调用，不要害怕多次调用
+   - 每次看到工具执行成功的结果后，就可以继续调用下一个工具
+
+**示例对话流程**：
 
-async def _should_save_to_memory_llm(user_message: str, ai_reply: str, llm_client) -> tuple[bool, str, str]:
+场景：报告中有3个建议：1) 优化内容策略 2) 加强差异化 3) 进行竞品分析
+
+CEO: "是，请帮我安排这些任务"
+
+第1轮 - 你调用工具：
+```
+anpaitask(taskname="优化内容策略", openid="ou_891645e9faf220921f1f54c2866a8298", starttime="2025-10-30T00:00:00Z", duetime="2025-11-05T23:59:59Z")
+```
+系统返回：任务已成功创建
+
+第2轮 - 你继续调用工具：
+```
+anpaitask(taskname="加强小红书内容差异化", openid="ou_891645e9faf220921f1f54c2866a8298", starttime="2025-10-30T00:00:00Z", duetime="2025-11-10T23:59:59Z")
+```
+系统返回：任务已成功创建
+
+第3轮 - 你继续调用工具：
+```
+anpaitask(taskname="进行市场竞争分析", openid="ou_891645e9faf220921f1f54c2866a8298", starttime="2025-10-30T00:00:00Z", duetime="2025-11-12T23:59:59Z")
+```
+系统返回：任务已成功创建
+
+第4轮 - 你生成最终总结：
+"好的，我已经为您创建了以下任务：
+
+✅ 任务1: 优化内容策略（截止11月5日）
+✅ 任务2: 加强小红书内容差异化（截止11月10日）
+✅ 任务3: 进行市场竞争分析（截止11月12日）
+
+所有任务已安排完成！共创建了3个任务，负责人都是测试员工，您可以在飞书中查看。\""""
+
+_S8_STYLE_PROMPT = "请用自然对话的方式回答用户的问题。回答要简洁、专业，就像一个真实的顾问在跟CEO对话。不要使用过多的表情符号，保持专业但友好的语气。"
+
+_S8_CONTEXT_PROMPT = "相关企业信息：\n{context}"
+
+# 流式对话（带飞书任务工具）
+S8_SYSTEM_PROMPT_TEMPLATE = "\n\n".join([
+    _S8_ROLE_PROMPT, _S8_TOOL_RULES_PROMPT, _S8_STYLE_PROMPT, _S8_CONTEXT_PROMPT
+])
+
+# 普通对话（不带工具）
+S8_CHAT_SYSTEM_PROMPT_TEMPLATE = "\n\n".join([
+    _S8_ROLE_PROMPT, _S8_STYLE_PROMPT, _S8_CONTEXT_PROMPT
+])
+
+
+def _build_system_message(context: str, with_tools: bool = False) -> Dict:
+    """构建S8系统消息"""
+    template = S8_SYSTEM_PROMPT_TEMPLATE if with_tools else S8_CHAT_SYSTEM_PROMPT_TEMPLATE
+    return {
+        "role": "system",
+        "content": template.format(context=context or "暂无相关信息")
+    }
+
+
+def _trim_history(
+    conversation_history: Optional[List[Dict]],
+    max_messages: int = MAX_HISTORY_MESSAGES,
+    max_chars: int = MAX_HISTORY_CHARS
+) -> List[Dict]:
+    """保留最近的历史消息：最多max_messages条、总字符数不超过max_chars，更早的丢弃"""
+    if not conversation_history:
+        return []
+
+    kept = []
+    total = 0
+    for msg in reversed(conversation_history[-max_messages:]):
+        total += len(str(msg.get("content") or ""))
+        if kept and total > max_chars:
+            break
+        kept.append(msg)
+    kept.reverse()
+    return kept
+
+
+def _reply_scope(memory_version: int, conversation_history: Optional[List[Dict]]) -> str:
     """
-    使用 LLM 智能判断对话是否值得保存到长期记忆
-    参考 ChatGPT 的记忆管理机制
+    回复缓存的作用域：记忆版本 + 对话历史摘要
 
-    返回：(是否保存, 提取的关键信息摘要, 记忆类型)
+    回复依据检索到的企业记忆生成，记忆有增删改后旧回复不再复用；历史不同的对话也不共享缓存
     """
-    prompt = f"""你是企业记忆管理助手，负责从CEO与决策助手的对话中提取**企业和业务相关**的关键信息。
-
-**重要原则：这是企业大脑，只记录企业经营相关的信息，不记录CEO的个人信息。**
-
-**对话内容：**
-CEO问：{user_message}
-S8答：{ai_reply}
-
-**应该保存的信息类型：**
-
-1. **工作偏好** (work_preference)
-   - CEO的决策风格、管理风格（作为工作方式）
-   - 会议习惯、汇报偏好
-   - 回答格式偏好（如"我希望看数据驱动的分析"）
-   - 注意：只记录**工作相关**的偏好
-
-2. **公司背景** (company_background)
-   - 公司名称、业务类型、商业模式
-   - 团队规模、组织架构
-   - 行业背景、市场定位
-   - **不包括CEO个人信息**（姓名、年龄、学历等）
-
-3. **业务决策和计划** (business_decision)
-   - 重要的战略决策
-   - 具体的行动计划
-   - 任务分配和责任人
-   - 明确的业务目标和截止时间
-
-4. **业务洞察** (business_insight)
-   - 关键业务指标和趋势
-   - 风险识别和分析
-   - 市场洞察、竞品分析
-   - 客户反馈和需求
-
-**明确排除的内容：**
-- ❌ CEO的个人信息：姓名、年龄、个人背景、家庭情况
-- ❌ 个人兴趣爱好：食物偏好、娱乐方式等
-- ❌ 简单问候和闲聊
-- ❌ 技术操作问题
-- ❌ 临时性、重复性内容
-
-**示例对比：**
-- ✅ "公司是50人的跨境电商团队" → 应该保存（company_background）
-- ❌ "我叫张三，今年30岁" → 不应该保存（个人信息）
-- ✅ "我偏好数据驱动的决策方式" → 应该保存（work_preference）
-- ❌ "我喜欢喝咖啡" → 不应该保存（个人喜好）
-
-**请输出JSON格式：**
-{{
-  "should_save": true/false,
-  "memory_type": "work_preference/company_background/business_decision/business_insight/none",
-  "reason": "判断理由（简短）",
-  "summary": "如果需要保存，提取核心信息（1-2句话，客观陈述）。例如：'公司主营跨境电商业务，团队50人' 或 '计划Q2重点优化转化率'"
-}}
-
-只输出JSON，不要其他内容。"""
+    if not conversation_history:
+        return f"m{memory_version}"
+    raw = orjson.dumps(conversation_history, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return f"m{memory_version}:{hashlib.sha256(raw).hexdigest()}"
+
+
+def _is_trivial(user_message: str) -> bool:
+    """是否为简短的寒暄（如“你好”），这类消息不需要检索记忆"""
+    return len(user_message) < 10 and _GREETING_RE.search(user_message.lower()) is not None
+
+
+async def _search_enterprise_memories(app_state, user_message: str) -> list:
+    """搜索企业级记忆（在线程池中执行，不阻塞事件循环；超时按无记忆处理）"""
+    if _is_trivial(user_message):
+        print("💬 简短寒暄，跳过记忆搜索")
+        return []
 
     try:
-        response = await llm_client.async_chat_completion([
-            {"role": "user", "content": prompt}
-        ])
+        # 使用 system 确保能搜到所有记忆
+        memories = await search_memories_async(
+            app_state.memory_manager,
+            query=user_message,
+            user_id="system",
+            level="enterprise",      # 🔑 只读企业级记忆
+            domain="enterprise",     # 🔑 只读企业域
+            limit=5
+        )
+    except Exception as e:
+        print(f"⚠️  搜索企业级记忆失败: {e}")
+        return []
 
-        if response.get("error"):
-            print(f"  ⚠️ LLM判断失败，使用关键词备用方案: {response['error']}")
-            return _should_save_to_memory_keyword(user_message, ai_reply), None
-
-        # 解析 LLM 返回
-        import json
-        content = response.get("content", "{}")
-
-        # 处理 markdown 代码块
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].split("```")[0].strip()
-
-        result = json.loads(content)
-        should_save = result.get("should_save", False)
-        memory_type = result.get("memory_type", "none")
-        reason = result.get("reason", "")
-        summary = result.get("summary", "")
-
-        if should_save:
-            print(f"  ✓ [LLM判断] 值得保存的信息")
-            print(f"    类型: {memory_type}")
-            print(f"    理由: {reason}")
-            print(f"    摘要: {summary}")
-        else:
-            print(f"  ✗ [LLM判断] 无需保存")
-            print(f"    理由: {reason}")
-
-        return should_save, summary if should_save else None, memory_type
+    # 固定排序：同样的数据每轮拼出逐字节相同的上下文，便于命中模型侧的提示词前缀缓存
+    memories.sort(key=lambda m: (-m.score, m.content))
+    print(f"✅ 找到 {len(memories)} 条相关企业级记忆")
+    return memories
 
+
+async def _load_mcp_tools(app_state) -> Optional[List[Dict]]:
+    """获取MCP工具（如果可用，在线程池中执行）"""
+    if not app_state.mcp_client:
+        return None
+
+    try:
+        tools = await asyncio.to_thread(app_state.mcp_client.get_tools_for_openai)
+        print(f"🔧 已加载 {len(tools)} 个MCP工具")
+        return tools
     except Exception as e:
-        print(f"  ⚠️ LLM判断异常，使用关键词备用方案: {e}")
-        return _should_save_to_memory_keyword(user_message, ai_reply), None, "decision"
+        print(f"⚠️  获取MCP工具失败: {e}")
+        return None
 
 
 def _should_save_to_memory_keyword(user_message: str, ai_reply: str) -> bool:
     """
-    关键词匹配备用方案（当LLM不可用时）
+    关键词匹配（LLM判断前的预筛选，也是LLM不可用时的备用方案）
     """
-    decision_keywords = ["决定", "决策", "计划", "策略", "方案", "建议", "应该", "需要", "必须"]
-    data_keywords = ["数据", "指标", "百分比", "%", "增长", "下降", "风险", "目标"]
-    action_keywords = ["执行", "安排", "负责", "完成", "截止", "任务", "行动"]
+    # 先做廉价的长度/寒暄判断；关键词已合成一个正则，分别扫描问和答，不拼接长回复
+    return (
+        len(user_message) + len(ai_reply) > 20
+        and not _is_trivial(user_message)
+        and (
+            _SAVE_KEYWORDS_RE.search(user_message) is not None
+            or _SAVE_KEYWORDS_RE.search(ai_reply) is not None
+        )
+    )
 
-    combined_text = user_message + ai_reply
-    has_keywords = any(kw in combined_text for kw in decision_keywords + data_keywords + action_keywords)
-    has_substance = len(combined_text) > 20
 
-    greetings = ["你好", "您好", "hi", "hello", "早上好", "晚上好"]
-    is_greeting = any(g in user_message.lower() for g in greetings) and len(user_message) < 10
+# S8 Agent实例（报告状态保存在实例上，各接口必须共用同一个）
+_s8_agent: Optional[S8DecisionAgent] = None
 
-    return has_keywords and has_substance and not is_greeting
+
+def _get_s8_agent(app_state) -> S8DecisionAgent:
+    """获取S8 Agent，首次调用时创建"""
+    global _s8_agent
+    if _s8_agent is None:
+        _s8_agent = S8DecisionAgent("S8", app_state.memory_manager, app_state.llm_client)
+    return _s8_agent
 
 
 class GenerateReportRequest(BaseModel):
@@ -175,8 +287,7 @@ async def generate_report(request: GenerateReportRequest):
     if not app_state.memory_manager or not app_state.llm_client:
         raise HTTPException(status_code=500, detail="系统未初始化")
 
-    # 创建S8 Agent
-    agent = S8DecisionAgent("S8", app_state.memory_manager, app_state.llm_client)
+    agent = _get_s8_agent(app_state)
 
     try:
         report = await agent.generate_report(request.input_data)
@@ -229,8 +340,7 @@ async def confirm_actions(request: ConfirmActionsRequest):
     if not app_state.memory_manager or not app_state.llm_client:
         raise HTTPException(status_code=500, detail="系统未初始化")
 
-    # 创建S8 Agent
-    agent = S8DecisionAgent("S8", app_state.memory_manager, app_state.llm_client)
+    agent = _get_s8_agent(app_state)
 
     try:
         result = await agent.confirm_actions(
@@ -264,109 +374,61 @@ async def chat_with_s8_stream(request: ChatRequest):
 
     async def generate_stream():
         """生成流式响应（支持MCP工具调用）"""
-        full_reply = ""  # 收集完整回复用于后续记忆判断
+        full_reply_parts: List[str] = []  # 收集完整回复用于后续记忆判断（结束时一次性拼接）
+        used_tools = False  # 调用过工具的回复有副作用，不写入缓存
+        has_error = False
+
+        # 文本块合并发送：攒够字符数或超过时间间隔才发一帧，减少小包和事件循环唤醒
+        loop = asyncio.get_running_loop()
+        pending: List[str] = []
+        pending_len = 0
+        last_flush = loop.time()
+
+        def flush_pending() -> Optional[bytes]:
+            """取出待发送的文本块，合并为一帧SSE（没有则返回None）"""
+            nonlocal pending_len, last_flush
+            if not pending:
+                return None
+            frame = sse_content("".join(pending))
+            pending.clear()
+            pending_len = 0
+            last_flush = loop.time()
+            return frame
 
         try:
-            print("🔍 搜索相关企业级记忆...")
-            # 搜索企业级记忆（使用 system 确保能搜到所有记忆）
-            memories = app_state.memory_manager.search_memories(
-                query=user_message,
-                user_id="system",
-                level="enterprise",      # 🔑 只读企业级记忆
-                domain="enterprise",     # 🔑 只读企业域
-                limit=5
+            # 回复缓存：命中则直接回放，跳过LLM调用和记忆保存
+            history = _trim_history(request.conversation_history)
+            cache_scope = _reply_scope(app_state.memory_manager.memory_version, history)
+            cache_key = SemanticResponseCache.make_key("s8_chat_stream", user_message, cache_scope)
+            query_emb = await embed_query_async(app_state.memory_manager, user_message)
+            cached_reply = _response_cache.get(cache_key, query_emb, cache_scope)
+            if cached_reply is not None:
+                print("⚡ 命中回复缓存，跳过LLM调用")
+                for i in range(0, len(cached_reply), _CACHED_REPLY_CHUNK_SIZE):
+                    content = cached_reply[i:i + _CACHED_REPLY_CHUNK_SIZE]
+                    yield sse_content(content)
+                    # 回放是纯同步循环，每段后让出事件循环
+                    await asyncio.sleep(0)
+                yield SSE_DONE
+                return
+
+            print("🔍 搜索相关企业级记忆，并加载MCP工具...")
+            # 记忆搜索与MCP工具加载互不依赖，并发执行
+            memories, tools = await asyncio.gather(
+                _search_enterprise_memories(app_state, user_message),
+                _load_mcp_tools(app_state)
             )
-            print(f"✅ 找到 {len(memories)} 条相关企业级记忆")
 
             # 构建上下文
             context = "\n".join([f"- {m.content}" for m in memories])
 
             # 构建消息
-            messages = [
-                {
-                    "role": "system",
-                    "content": f"""你是S8决策军师，一个帮助CEO做决策的AI助手。
-
-相关企业信息：
-{context if context else "暂无相关信息"}
-
-你可以使用飞书任务工具来帮助CEO安排任务。
-
-**工具使用规则：**
-
-1. **单个任务创建**：
-   - 工具名称：anpaitask
-   - 参数说明：
-     * taskname: 任务名称（从建议中提取）
-     * openid: 测试员工ID固定为 ou_891645e9faf220921f1f54c2866a8298
-     * starttime: 任务开始时间（ISO 8601格式，默认今天）
-     * duetime: 任务截止时间（ISO 8601格式，根据紧急程度推断：紧急=3天后，一般=7天后）
-
-2. **批量任务创建流程（多轮调用）**：
-   当CEO说"是，请帮我安排这些任务"或类似确认语句时：
-
-   步骤1：回顾之前生成的报告，找出所有行动建议（通常有3-5个）
-
-   步骤2：逐个创建任务（支持多轮调用）
-   - 调用anpaitask创建第1个任务
-   - 看到第1个任务创建成功后，继续调用anpaitask创建第2个任务
-   - 看到第2个任务创建成功后，继续调用anpaitask创建第3个任务
-   - ...以此类推，直到所有任务创建完成
-   - **提示**：系统支持多轮工具调用，每次工具执行后你都可以继续调用下一个
-
-   步骤3：所有任务创建完成后，用自然语言总结已创建的任务清单
-
-3. **缺失信息处理**：
-   - 负责人（openid）：默认使用测试员工ID ou_891645e9faf220921f1f54c2866a8298
-   - 截止时间（duetime）：如果报告中有明确时间（如"11月5日前"），使用该时间；否则根据紧急程度推断
-   - 开始时间（starttime）：默认今天
-
-4. **重要提醒**：
-   - 一次anpaitask调用只能创建一个任务
-   - 系统支持多轮工具调用，不要害怕多次调用
-   - 每次看到工具执行成功的结果后，就可以继续调用下一个工具
-
-**示例对话流程**：
-
-场景：报告中有3个建议：1) 优化内容策略 2) 加强差异化 3) 进行竞品分析
-
-CEO: "是，请帮我安排这些任务"
-
-第1轮 - 你调用工具：
-```
-anpaitask(taskname="优化内容策略", openid="ou_891645e9faf220921f1f54c2866a8298", starttime="2025-10-30T00:00:00Z", duetime="2025-11-05T23:59:59Z")
-```
-系统返回：任务已成功创建
-
-第2轮 - 你继续调用工具：
-```
-anpaitask(taskname="加强小红书内容差异化", openid="ou_891645e9faf220921f1f54c2866a8298", starttime="2025-10-30T00:00:00Z", duetime="2025-11-10T23:59:59Z")
-```
-系统返回：任务已成功创建
-
-第3轮 - 你继续调用工具：
-```
-anpaitask(taskname="进行市场竞争分析", openid="ou_891645e9faf220921f1f54c2866a8298", starttime="2025-10-30T00:00:00Z", duetime="2025-11-12T23:59:59Z")
-```
-系统返回：任务已成功创建
-
-第4轮 - 你生成最终总结：
-"好的，我已经为您创建了以下任务：
-
-✅ 任务1: 优化内容策略（截止11月5日）
-✅ 任务2: 加强小红书内容差异化（截止11月10日）
-✅ 任务3: 进行市场竞争分析（截止11月12日）
-
-所有任务已安排完成！共创建了3个任务，负责人都是测试员工，您可以在飞书中查看。"
-
-请用自然对话的方式回答用户的问题。回答要简洁、专业，就像一个真实的顾问在跟CEO对话。不要使用过多的表情符号，保持专业但友好的语气。"""
-                }
-            ]
+            messages = [_build_system_message(context, with_tools=True)]
 
             # 添加对话历史
-            if request.conversation_history:
-                print(f"📚 包含 {len(request.conversation_history)} 条历史消息")
-                messages.extend(request.conversation_history)
+            if history:
+                print(f"📚 包含 {len(history)} 条历史消息")
+                messages.extend(history)
 
             # 添加当前用户消息
             messages.append({
@@ -374,15 +436,6 @@ anpaitask(taskname="进行市场竞争分析", openid="ou_891645e9faf220921f1f54
                 "content": user_message
             })
 
-            # 获取MCP工具（如果可用）
-            tools = None
-            if app_state.mcp_client:
-                try:
-                    tools = app_state.mcp_client.get_tools_for_openai()
-                    print(f"🔧 已加载 {len(tools)} 个MCP工具")
-                except Exception as e:
-                    print(f"⚠️  获取MCP工具失败: {e}")
-
             print("🤖 开始流式调用LLM...")
 
             # 递归循环：持续处理工具调用，直到LLM不再需要调用工具
@@ -402,48 +455,52 @@ anpaitask(taskname="进行市场竞争分析", openid="ou_891645e9faf220921f1f54
                     # 文本内容
                     if chunk_type == "content":
                         content = chunk.get("content", "")
-                        full_reply += content
-                        # 发送SSE格式数据
-                        yield f"data: {json.dumps({'type': 'content', 'content': content}, ensure_ascii=False)}\n\n"
+                        full_reply_parts.append(content)
+                        pending.append(content)
+                        pending_len += len(content)
+                        # 发送SSE格式数据（按大小/时间合并）
+                        if pending_len >= _SSE_FLUSH_CHARS or loop.time() - last_flush >= _SSE_FLUSH_INTERVAL:
+                            yield flush_pending()
+                            # 让出事件循环：合并后的帧立即下发，其他协程也能得到调度
+                            await asyncio.sleep(0)
 
                     # 工具调用
                     elif chunk_type == "tool_calls":
                         has_tool_calls = True
+                        used_tools = True
                         tool_calls = chunk.get("tool_calls", [])
                         print(f"🔧 LLM请求调用 {len(tool_calls)} 个工具")
 
-                        # 通知前端工具调用开始
-                        yield f"data: {json.dumps({'type': 'tool_call_start', 'tool_calls': tool_calls}, ensure_ascii=False)}\n\n"
+                        # 通知前端工具调用开始（先发出已缓冲的文本）
+                        frame = flush_pending()
+                        if frame:
+                            yield frame
+                        yield sse_event({'type': 'tool_call_start', 'tool_calls': tool_calls})
 
-                        # 执行工具调用
-                        tool_results = []
+                        # 执行工具调用（各工具互不依赖，在线程池中并发执行）
                         for tool_call in tool_calls:
+                            print(f"  🛠️ 调用工具: {tool_call['function']['name']}")
+                            print(f"  📝 参数: {tool_call['function']['arguments']}")
+
+                        results = await asyncio.gather(
+                            *[
+                                _call_mcp_tool(
+                                    app_state,
+                                    tool_call["function"]["name"],
+                                    tool_call["function"]["arguments"]
+                                )
+                                for tool_call in tool_calls
+                            ],
+                            return_exceptions=True
+                        )
+
+                        # 按原顺序回填结果并通知前端
+                        tool_results = []
+                        for tool_call, result in zip(tool_calls, results):
                             tool_name = tool_call["function"]["name"]
-                            tool_args_str = tool_call["function"]["arguments"]
 
-                            print(f"  🛠️ 调用工具: {tool_name}")
-                            print(f"  📝 参数: {tool_args_str}")
-
-                            try:
-                                import json as json_lib
-                                tool_args = json_lib.loads(tool_args_str)
-
-                                # 调用MCP工具
-                                result = app_state.mcp_client.call_tool(tool_name, tool_args)
-                                print(f"  ✅ 工具执行成功: {result}")
-
-                                tool_results.append({
-                                    "tool_call_id": tool_call["id"],
-                                    "role": "tool",
-                                    "name": tool_name,
-                                    "content": json_lib.dumps(result, ensure_ascii=False)
-                                })
-
-                                # 通知前端工具执行成功
-                                yield f"data: {json.dumps({'type': 'tool_result', 'tool_name': tool_name, 'result': result}, ensure_ascii=False)}\n\n"
-
-                            except Exception as e:
-                                error_msg = f"工具调用失败: {str(e)}"
+                            if isinstance(result, Exception):
+                                error_msg = f"工具调用失败: {str(result)}"
                                 print(f"  ❌ {error_msg}")
                                 tool_results.append({
                                     "tool_call_id": tool_call["id"],
@@ -451,7 +508,19 @@ anpaitask(taskname="进行市场竞争分析", openid="ou_891645e9faf220921f1f54
                                     "name": tool_name,
                                     "content": error_msg
                                 })
-                                yield f"data: {json.dumps({'type': 'tool_error', 'tool_name': tool_name, 'error': error_msg}, ensure_ascii=False)}\n\n"
+                                yield sse_event({'type': 'tool_error', 'tool_name': tool_name, 'error': error_msg})
+                                continue
+
+                            print(f"  ✅ 工具执行成功: {result}")
+                            tool_results.append({
+                                "tool_call_id": tool_call["id"],
+                                "role": "tool",
+                                "name": tool_name,
+                                "content": orjson.dumps(result, option=orjson.OPT_NON_STR_KEYS).decode()
+                            })
+
+                            # 通知前端工具执行成功
+                            yield sse_event({'type': 'tool_result', 'tool_name': tool_name, 'result': result})
 
                         # 将工具调用和结果添加到消息历史
                         messages.append({
@@ -468,87 +537,53 @@ anpaitask(taskname="进行市场竞争分析", openid="ou_891645e9faf220921f1f54
                     elif chunk_type == "done":
                         if not has_tool_calls:
                             # 没有工具调用，说明LLM已经生成了最终回复
-                            print(f"✅ 流式输出完成，总长度: {len(full_reply)}")
+                            print(f"✅ 流式输出完成，总长度: {sum(map(len, full_reply_parts))}")
                         break
 
                     # 错误
                     elif chunk_type == "error":
                         error = chunk.get("error", "未知错误")
                         print(f"❌ LLM错误: {error}")
-                        yield f"data: {json.dumps({'type': 'error', 'error': error}, ensure_ascii=False)}\n\n"
+                        has_error = True
+                        frame = flush_pending()
+                        if frame:
+                            yield frame
+                        yield sse_event({'type': 'error', 'error': error})
                         break
 
+                # 本轮结束，发出剩余的缓冲文本
+                frame = flush_pending()
+                if frame:
+                    yield frame
+
                 # 如果这一轮没有工具调用，说明任务完成，退出循环
                 if not has_tool_calls:
                     break
 
             # 发送完成标志
-            yield f"data: {json.dumps({'type': 'done'}, ensure_ascii=False)}\n\n"
+            yield SSE_DONE
 
-            # 🧠 异步处理记忆保存（不阻塞流式输出）
-            asyncio.create_task(
-                _save_memory_async(user_message, full_reply, request.session_id, app_state)
-            )
+            full_reply = "".join(full_reply_parts)
+            if full_reply and not used_tools and not has_error:
+                _response_cache.put(cache_key, full_reply, query_emb, cache_scope)
 
-        except Exception as e:
-            import traceback
-            error_detail = traceback.format_exc()
-            print(f"❌ 流式对话失败: {error_detail}")
-            yield f"data: {json.dumps({'type': 'error', 'error': str(e)}, ensure_ascii=False)}\n\n"
-
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no"  # 禁用Nginx缓冲
-        }
-    )
+            # 🧠 关键词预筛选通过的对话交给后台批量判断和保存（不阻塞流式输出）
+            if _should_save_to_memory_keyword(user_message, full_reply):
+                get_memory_writer().enqueue(user_message, full_reply, request.session_id)
+            else:
+                print(f"⏭️  对话不含关键信息，跳过记忆判断")
 
+        except Exception as e:
+            logger.exception("❌ 流式对话失败")
+            yield sse_event({'type': 'error', 'error': str(e)})
 
-async def _save_memory_async(user_message: str, ai_reply: str, session_id: Optional[str], app_state):
-    """
-    异步保存记忆（不阻塞主流程）
+    return event_stream_response(generate_stream())
 
-    利用 Mem0 的原生能力：
-    - Mem0 会自动判断是 Add/Update/Merge
-    - 相似内容会自动合并，避免重复
-    """
-    try:
-        print(f"🤔 [后台] 判断对话是否需要保存到长期记忆...")
-        should_save, summary, memory_type = await _should_save_to_memory_llm(
-            user_message, ai_reply, app_state.llm_client
-        )
 
-        if should_save:
-            # 使用 "system" 作为 user_id，保证记忆全局可见
-            # CEO 的偏好、背景、决策应该在所有场景下都能被召回
-            user_id = "system"
-
-            # 使用 LLM 提取的摘要（更精炼，易于去重）
-            memory_text = summary if summary else f"CEO问: {user_message}\nS8答: {ai_reply}"
-
-            print(f"💾 [后台] 保存到长期记忆")
-            print(f"    类型: {memory_type}")
-
-            # 🔑 关键：Mem0 会自动判断这条记忆是新增还是更新已有记忆
-            # 它使用向量相似度来避免重复
-            memory_result = app_state.memory_manager.add_memory(
-                content=memory_text,
-                user_id=user_id,
-                metadata={
-                    "level": "enterprise",       # 🔑 企业级记忆
-                    "domain": "enterprise",      # 🔑 企业域
-                    "category": memory_type,     # work_preference/company_background/business_decision/business_insight
-                    "timestamp": str(datetime.now()),
-                    "source": "s8_chat",
-                    "scope": {"sessionId": session_id}
-                }
-            )
-            print(f"✅ [后台] 记忆已保存: {memory_result}")
-    except Exception as e:
-        print(f"⚠️ [后台] 保存记忆失败: {e}")
+async def _call_mcp_tool(app_state, tool_name: str, tool_args_str: str):
+    """解析参数并在线程池中调用MCP工具（同步HTTP调用，不阻塞事件循环）"""
+    tool_args = orjson.loads(tool_args_str or "{}")
+    return await asyncio.to_thread(app_state.mcp_client.call_tool, tool_name, tool_args)
 
 
 @router.post("/chat")
@@ -572,37 +607,32 @@ async def chat_with_s8(request: ChatRequest):
         raise HTTPException(status_code=400, detail="消息不能为空")
 
     try:
+        # 回复缓存：命中则直接返回，跳过LLM调用和记忆保存
+        history = _trim_history(request.conversation_history)
+        cache_scope = _reply_scope(app_state.memory_manager.memory_version, history)
+        cache_key = SemanticResponseCache.make_key("s8_chat", user_message, cache_scope)
+        query_emb = await embed_query_async(app_state.memory_manager, user_message)
+        cached_reply = _response_cache.get(cache_key, query_emb, cache_scope)
+        if cached_reply is not None:
+            print("⚡ 命中回复缓存，跳过LLM调用")
+            return {
+                "success": True,
+                "reply": cached_reply
+            }
+
         print("🔍 搜索相关企业级记忆...")
-        # 搜索企业级记忆（使用 system 确保能搜到所有记忆）
-        memories = app_state.memory_manager.search_memories(
-            query=user_message,
-            user_id="system",
-            level="enterprise",      # 🔑 只读企业级记忆
-            domain="enterprise",     # 🔑 只读企业域
-            limit=5
-        )
-        print(f"✅ 找到 {len(memories)} 条相关企业级记忆")
+        memories = await _search_enterprise_memories(app_state, user_message)
 
         # 构建上下文
         context = "\n".join([f"- {m.content}" for m in memories])
 
         # 构建消息
-        messages = [
-            {
-                "role": "system",
-                "content": f"""你是S8决策军师，一个帮助CEO做决策的AI助手。
-
-相关企业信息：
-{context if context else "暂无相关信息"}
-
-请用自然对话的方式回答用户的问题。回答要简洁、专业，就像一个真实的顾问在跟CEO对话。不要使用过多的表情符号，保持专业但友好的语气。"""
-            }
-        ]
+        messages = [_build_system_message(context)]
 
         # 添加对话历史
-        if request.conversation_history:
-            print(f"📚 包含 {len(request.conversation_history)} 条历史消息")
-            messages.extend(request.conversation_history)
+        if history:
+            print(f"📚 包含 {len(history)} 条历史消息")
+            messages.extend(history)
 
         # 添加当前用户消息
         messages.append({
@@ -612,7 +642,23 @@ async def chat_with_s8(request: ChatRequest):
 
         print("🤖 调用LLM...")
         # 调用LLM
-        response = await app_state.llm_client.async_chat_completion(messages)
+        try:
+            response = await asyncio.wait_for(
+                app_state.llm_client.async_chat_completion(messages),
+                LLM_CHAT_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            # 超时多是长回复拖慢：限制回复长度重试一次，仍超时则直接返回超时错误
+            print(f"⏱️ LLM调用超时（{LLM_CHAT_TIMEOUT}s），缩短回复长度重试")
+            try:
+                response = await asyncio.wait_for(
+                    app_state.llm_client.async_chat_completion(
+                        messages, max_tokens=LLM_CHAT_RETRY_MAX_TOKENS
+                    ),
+                    LLM_CHAT_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail="LLM响应超时，请稍后重试")
         print(f"✅ LLM响应: {response}")
 
         if response.get("error"):
@@ -622,39 +668,12 @@ async def chat_with_s8(request: ChatRequest):
         reply = response.get("content", "抱歉，我现在无法回答。")
         print(f"💬 回复: {reply[:100]}...")
 
-        # 🧠 智能判断：使用LLM分析对话是否值得保存到长期记忆
-        print(f"🤔 正在判断对话是否需要保存到长期记忆...")
-        should_save, summary, memory_type = await _should_save_to_memory_llm(
-            user_message, reply, app_state.llm_client
-        )
+        if reply:
+            _response_cache.put(cache_key, reply, query_emb, cache_scope)
 
-        if should_save:
-            try:
-                # 使用 "system" 作为 user_id，保证记忆全局可见
-                user_id = "system"
-
-                # 使用 LLM 提取的摘要（更精炼，易于去重）
-                memory_text = summary if summary else f"CEO问: {user_message}\nS8答: {reply}"
-
-                print(f"💾 保存到长期记忆")
-                print(f"    类型: {memory_type}")
-
-                # Mem0 会自动判断这条记忆是新增还是更新
-                memory_result = app_state.memory_manager.add_memory(
-                    content=memory_text,
-                    user_id=user_id,
-                    metadata={
-                        "level": "enterprise",       # 🔑 企业级记忆
-                        "domain": "enterprise",      # 🔑 企业域
-                        "category": memory_type,     # work_preference/company_background/business_decision/business_insight
-                        "timestamp": str(datetime.now()),
-                        "source": "s8_chat",
-                        "scope": {"sessionId": request.session_id}
-                    }
-                )
-                print(f"✅ 记忆已保存: {memory_result}")
-            except Exception as e:
-                print(f"⚠️ 保存记忆失败（不影响对话）: {e}")
+        # 🧠 关键词预筛选通过的对话交给后台批量判断和保存（不阻塞回复）
+        if _should_save_to_memory_keyword(user_message, reply):
+            get_memory_writer().enqueue(user_message, reply, request.session_id)
 
         return {
             "success": True,
@@ -663,9 +682,7 @@ async def chat_with_s8(request: ChatRequest):
     except HTTPException:
         raise
     except Exception as e:
-        import traceback
-        error_detail = traceback.format_exc()
-        print(f"❌ 对话失败: {error_detail}")
+        logger.exception("❌ 对话失败")
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -681,8 +698,7 @@ async def get_current_report():
     if not app_state.memory_manager or not app_state.llm_client:
         raise HTTPException(status_code=500, detail="系统未初始化")
 
-    # 创建S8 Agent（会保持单例状态）
-    agent = S8DecisionAgent("S8", app_state.memory_manager, app_state.llm_client)
+    agent = _get_s8_agent(app_state)
 
     if not agent.current_report:
         return {
@@ -704,6 +720,8 @@ async def websocket_endpoint(websocket: WebSocket):
     监听事件：
     - REPORT_UPDATED: 报告已更新
     - MEMORY_CONFLICT: 检测到记忆冲突
+
+    断线重连时带上 ?last_event_id=<最后收到的事件id>，会先补发断线期间错过的事件
     """
     await websocket.accept()
 
@@ -711,37 +729,30 @@ async def websocket_endpoint(websocket: WebSocket):
 
     event_bus = get_event_bus()
 
-    # 定义事件处理器
-    async def on_report_updated(data: Dict):
-        await websocket.send_json({
-            "type": "report_updated",
-            "data": data
-        })
-
-    async def on_conflict(data: Dict):
-        await websocket.send_json({
-            "type": "memory_conflict",
-            "data": data
-        })
-
-    async def on_node_status(data: Dict):
-        await websocket.send_json({
-            "type": "node_status",
-            "data": data
-        })
-
-    # 订阅事件
-    event_bus.subscribe(EventNames.REPORT_UPDATED, on_report_updated)
-    event_bus.subscribe(EventNames.MEMORY_CONFLICT, on_conflict)
-    event_bus.subscribe("node_status", on_node_status)
+    # 订阅事件：事件总线把编码好的JSON文本放入本连接的队列，这里只负责发送
+    queue = event_bus.subscribe_queue(
+        [EventNames.REPORT_UPDATED, EventNames.MEMORY_CONFLICT, "node_status"],
+        last_event_id=websocket.query_params.get("last_event_id")
+    )
 
+    receive_task = asyncio.ensure_future(websocket.receive_text())
+    event_task = asyncio.ensure_future(queue.get())
     try:
         while True:
-            # 接收客户端消息（保持连接）
-            data = await websocket.receive_text()
-            # 可以处理客户端的ping/pong等
-            if data == "ping":
-                await websocket.send_json({"type": "pong"})
+            done, _ = await asyncio.wait(
+                {receive_task, event_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if event_task in done:
+                await websocket.send_text(event_task.result())
+                event_task = asyncio.ensure_future(queue.get())
+
+            if receive_task in done:
+                # 接收客户端消息（保持连接），可以处理客户端的ping/pong等
+                data = receive_task.result()
+                if data == "ping":
+                    await websocket.send_json({"type": "pong"})
+                receive_task = asyncio.ensure_future(websocket.receive_text())
 
     except WebSocketDisconnect:
         print("WebSocket断开连接")
@@ -749,6 +760,6 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"WebSocket错误: {e}")
     finally:
         # 取消订阅
-        event_bus.unsubscribe(EventNames.REPORT_UPDATED, on_report_updated)
-        event_bus.unsubscribe(EventNames.MEMORY_CONFLICT, on_conflict)
-        event_bus.unsubscribe("node_status", on_node_status)
+        receive_task.cancel()
+        event_task.cancel()
+        event_bus.drop_queue(queue)
@@ -2,9 +2,11 @@
 Scenarios API
 场景执行接口
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
+import hashlib
+import orjson
 from app.core.state import get_app_state
 from app.core.agent import get_orchestrator
 
@@ -18,69 +20,85 @@ class StartScenarioRequest(BaseModel):
     mode: str = "demo"  # demo/real
 
 
+# 场景列表是静态数据：导入时序列化一次，并用内容哈希作为ETag
+_SCENARIOS = [
+    {
+        "id": "S1",
+        "name": "AI全域营销",
+        "description": "主动式营销内容生成与投放建议",
+        "highlight": "主动式"
+    },
+    {
+        "id": "S2",
+        "name": "AI智能销售",
+        "description": "个性化销售跟进与触达建议",
+        "highlight": "主动式"
+    },
+    {
+        "id": "S3",
+        "name": "AI智能客服",
+        "description": "对话式客服，带记忆与来源证明",
+        "highlight": "企业大脑"
+    },
+    {
+        "id": "S4",
+        "name": "AI内容生产",
+        "description": "企业风格统一的内容生成",
+        "highlight": "企业大脑"
+    },
+    {
+        "id": "S5",
+        "name": "AI全流程优化",
+        "description": "项目/OKR进度管理与优化建议",
+        "highlight": "主动式"
+    },
+    {
+        "id": "S6",
+        "name": "AI数据分析",
+        "description": "自动异常检测与行动建议",
+        "highlight": "主动式"
+    },
+    {
+        "id": "S7",
+        "name": "AI风控合规",
+        "description": "基于企业红线的合同审查",
+        "highlight": "企业大脑"
+    },
+    {
+        "id": "S8",
+        "name": "AI决策军师",
+        "description": "CEO视角的经营简报与行动建议",
+        "highlight": "企业大脑"
+    }
+]
+
+_SCENARIOS_PAYLOAD = orjson.dumps({
+    "success": True,
+    "scenarios": _SCENARIOS,
+    "count": len(_SCENARIOS)
+})
+_SCENARIOS_ETAG = f'"{hashlib.md5(_SCENARIOS_PAYLOAD).hexdigest()}"'
+_SCENARIOS_HEADERS = {
+    "ETag": _SCENARIOS_ETAG,
+    "Cache-Control": "public, max-age=3600"
+}
+
+
 @router.get("/list")
-async def list_scenarios():
+async def list_scenarios(request: Request):
     """
     获取所有场景列表
 
-    返回8个场景的基本信息
+    返回8个场景的基本信息（客户端带 If-None-Match 且未变化时返回304）
     """
-    scenarios = [
-        {
-            "id": "S1",
-            "name": "AI全域营销",
-            "description": "主动式营销内容生成与投放建议",
-            "highlight": "主动式"
-        },
-        {
-            "id": "S2",
-            "name": "AI智能销售",
-            "description": "个性化销售跟进与触达建议",
-            "highlight": "主动式"
-        },
-        {
-            "id": "S3",
-            "name": "AI智能客服",
-            "description": "对话式客服，带记忆与来源证明",
-            "highlight": "企业大脑"
-        },
-        {
-            "id": "S4",
-            "name": "AI内容生产",
-            "description": "企业风格统一的内容生成",
-            "highlight": "企业大脑"
-        },
-        {
-            "id": "S5",
-            "name": "AI全流程优化",
-            "description": "项目/OKR进度管理与优化建议",
-            "highlight": "主动式"
-        },
-        {
-            "id": "S6",
-            "name": "AI数据分析",
-            "description": "自动异常检测与行动建议",
-            "highlight": "主动式"
-        },
-        {
-            "id": "S7",
-            "name": "AI风控合规",
-            "description": "基于企业红线的合同审查",
-            "highlight": "企业大脑"
-        },
-        {
-            "id": "S8",
-            "name": "AI决策军师",
-            "description": "CEO视角的经营简报与行动建议",
-            "highlight": "企业大脑"
-        }
-    ]
-
-    return {
-        "success": True,
-        "scenarios": scenarios,
-        "count": len(scenarios)
-    }
+    if request.headers.get("if-none-match") == _SCENARIOS_ETAG:
+        return Response(status_code=304, headers=_SCENARIOS_HEADERS)
+
+    return Response(
+        content=_SCENARIOS_PAYLOAD,
+        media_type="application/json",
+        headers=_SCENARIOS_HEADERS
+    )
 
 
 @router.get("/{scenario_id}")
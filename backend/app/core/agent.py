@@ -2,23 +2,54 @@
 Agent Orchestrator - Agent编排引擎基础框架
 基于LangGraph实现多Agent协同
 """
-from typing import TypedDict, List, Dict, Optional, Callable
+from typing import Annotated, Any, TypedDict, List, Dict, Optional, Callable, Sequence
 from datetime import datetime
-from langgraph.graph import StateGraph, END
+import asyncio
+import threading
+from langgraph.graph import StateGraph, START, END
 from app.core.memory import MemoryManager
+from app.core.memory_async import embed_query_async
 from app.core.llm import LLMClient
 
 
+def _keep_last(left: Any, right: Any) -> Any:
+    return right
+
+
+def _merge_dict(left: Dict, right: Dict) -> Dict:
+    return {**(left or {}), **(right or {})}
+
+
+def _append_new(left: List, right: List) -> List:
+    """
+    合并列表：只追加left中没有的元素（按对象身份判断）
+
+    节点既可能返回完整状态（包含已有元素），也可能在并行分支中各自追加，
+    两种情况下都不会重复
+    """
+    left = left or []
+    seen = {id(item) for item in left}
+    return left + [item for item in (right or []) if id(item) not in seen]
+
+
 class AgentState(TypedDict):
-    """Agent状态定义"""
-    scenario_id: str  # S1-S8
-    current_node: str  # 当前节点
-    input_data: Dict  # 输入数据
-    memories: List[Dict]  # 召回的记忆
-    node_outputs: Dict  # 各节点输出
-    sources: List[Dict]  # 来源证明链
-    needs_confirmation: bool  # 是否需要人工确认
-    error: Optional[str]  # 错误信息
+    """
+    Agent状态定义
+
+    每个字段都声明了合并函数（reducer）：并行分支在同一步写入同一字段时，
+    LangGraph按合并函数汇总，而不是报并发写入冲突。
+    标量字段取最后写入的值（与顺序执行一致，节点可以清除 needs_confirmation/error）；
+    并行分支各自的确认需求或错误请写入 node_outputs，由汇合节点汇总
+    """
+    scenario_id: Annotated[str, _keep_last]  # S1-S8
+    current_node: Annotated[str, _keep_last]  # 当前节点
+    input_data: Annotated[Dict, _keep_last]  # 输入数据
+    memories: Annotated[List[Dict], _append_new]  # 召回的记忆
+    node_outputs: Annotated[Dict, _merge_dict]  # 各节点输出
+    sources: Annotated[List[Dict], _append_new]  # 来源证明链
+    needs_confirmation: Annotated[bool, _keep_last]  # 是否需要人工确认
+    error: Annotated[Optional[str], _keep_last]  # 错误信息
+    recall_cache: Annotated[Dict, _merge_dict]  # 本次运行的记忆召回结果：(记忆类型, 查询) -> 记忆列表
 
 
 class BaseAgentNode:
@@ -57,23 +88,40 @@ class BaseAgentNode:
         """
         raise NotImplementedError("子类必须实现execute方法")
 
-    def _recall_memories(self, query: str, memory_type: Optional[str] = None) -> List[Dict]:
+    def _recall_memories(
+        self,
+        query: str,
+        memory_type: Optional[str] = None,
+        state: Optional[AgentState] = None
+    ) -> List[Dict]:
         """
         召回相关记忆
 
+        跨运行的重复查询由 MemoryManager 的搜索缓存命中（记忆有修改时失效）；
+        传入state时，同一次运行中各节点的相同查询只检索一次，结果在整次运行中保持一致
+
         Args:
             query: 查询内容
             memory_type: 记忆类型
+            state: 当前状态（可选，用于本次运行内复用召回结果）
 
         Returns:
             记忆列表
         """
+        recall_cache = state.get("recall_cache") if state is not None else None
+        key = (memory_type, query)
+        if recall_cache is not None and key in recall_cache:
+            return list(recall_cache[key])
+
         memories = self.memory_manager.search_memories(
             query=query,
             memory_type=memory_type,
             enabled_only=True
         )
-        return [mem.to_dict() for mem in memories]
+        result = [mem.to_dict() for mem in memories]
+        if recall_cache is not None:
+            recall_cache[key] = result
+        return list(result)
 
     def _add_source(self, state: AgentState, memory_ids: List[str], additional_info: Dict = None):
         """
@@ -119,11 +167,34 @@ class ScenarioOrchestrator:
         """
         构建场景的状态图
 
+        互不依赖的节点（如记忆召回、数据获取、独立的LLM调用）用 add_parallel 并行执行：
+
+            graph = StateGraph(AgentState)
+            graph.add_node("recall", recall.execute)
+            graph.add_node("fetch", fetch.execute)
+            graph.add_node("analyze", analyze.execute)
+            self.add_parallel(graph, START, ["recall", "fetch"], "analyze")
+
         Returns:
             状态图
         """
         raise NotImplementedError("子类必须实现build_graph方法")
 
+    @staticmethod
+    def add_parallel(graph: StateGraph, from_node: str, to_nodes: Sequence[str], join_node: str):
+        """
+        添加并行分支：from_node 完成后 to_nodes 在同一步并发执行，全部完成后再执行 join_node
+
+        Args:
+            graph: 状态图
+            from_node: 分叉前的节点（可以是START）
+            to_nodes: 并行执行的节点
+            join_node: 汇合节点（等待所有分支完成）
+        """
+        for node in to_nodes:
+            graph.add_edge(from_node, node)
+        graph.add_edge(list(to_nodes), join_node)
+
     async def run(self, input_data: Dict, callback: Optional[Callable] = None) -> Dict:
         """
         运行场景
@@ -136,7 +207,14 @@ class ScenarioOrchestrator:
             最终结果
         """
         if not self.graph:
-            self.graph = self.build_graph()
+            self.graph = _compiled_graph(self)
+
+        # 预先在后台计算查询向量：向量按文本缓存，节点召回记忆时直接命中，
+        # 嵌入耗时与状态初始化、前置节点重叠
+        prefetch = None
+        query = input_data.get("query")
+        if isinstance(query, str) and query.strip() and self.memory_manager:
+            prefetch = asyncio.ensure_future(embed_query_async(self.memory_manager, query))
 
         # 初始化状态
         initial_state: AgentState = {
@@ -147,7 +225,8 @@ class ScenarioOrchestrator:
             "node_outputs": {},
             "sources": [],
             "needs_confirmation": False,
-            "error": None
+            "error": None,
+            "recall_cache": {}
         }
 
         # 执行状态图
@@ -163,11 +242,36 @@ class ScenarioOrchestrator:
                 "success": False,
                 "error": str(e)
             }
+        finally:
+            if prefetch is not None and not prefetch.done():
+                prefetch.cancel()
 
 
 # 场景注册表
 SCENARIO_REGISTRY: Dict[str, type] = {}
 
+# 各场景编译好的状态图（图结构与单次执行无关，编译一次后所有请求共用）
+_COMPILED_GRAPHS: Dict[str, Any] = {}
+# 各场景的编排器实例：scenario_id -> (记忆管理器, LLM客户端, 编排器)
+_ORCHESTRATORS: Dict[str, tuple] = {}
+_graph_lock = threading.Lock()
+
+
+def _compiled_graph(orchestrator: "ScenarioOrchestrator"):
+    """取场景编译好的状态图，第一次使用时构建并编译"""
+    graph = _COMPILED_GRAPHS.get(orchestrator.scenario_id)
+    if graph is not None:
+        return graph
+    with _graph_lock:
+        graph = _COMPILED_GRAPHS.get(orchestrator.scenario_id)
+        if graph is None:
+            graph = orchestrator.build_graph()
+            # build_graph 可能返回未编译的StateGraph
+            if isinstance(graph, StateGraph):
+                graph = graph.compile()
+            _COMPILED_GRAPHS[orchestrator.scenario_id] = graph
+    return graph
+
 
 def register_scenario(scenario_id: str):
     """
@@ -198,9 +302,33 @@ def get_orchestrator(
         llm_client: LLM客户端
 
     Returns:
-        编排器实例
+        编排器实例（同一场景、同一组依赖复用同一个实例）
     """
+    cached = _ORCHESTRATORS.get(scenario_id)
+    if cached and cached[0] is memory_manager and cached[1] is llm_client:
+        return cached[2]
+
     orchestrator_class = SCENARIO_REGISTRY.get(scenario_id)
     if orchestrator_class:
-        return orchestrator_class(scenario_id, memory_manager, llm_client)
+        orchestrator = orchestrator_class(scenario_id, memory_manager, llm_client)
+        _ORCHESTRATORS[scenario_id] = (memory_manager, llm_client, orchestrator)
+        return orchestrator
     return None
+
+
+def prewarm_scenarios(memory_manager: MemoryManager, llm_client: LLMClient):
+    """
+    启动时预先编译所有已注册场景的状态图，首个请求不再承担编译耗时
+
+    未实现build_graph的场景（如S8直接调用的Agent）跳过
+    """
+    for scenario_id, orchestrator_class in list(SCENARIO_REGISTRY.items()):
+        # 不实例化没有状态图的场景，避免提前触发其初始化逻辑
+        if orchestrator_class.build_graph is ScenarioOrchestrator.build_graph:
+            continue
+        orchestrator = get_orchestrator(scenario_id, memory_manager, llm_client)
+        try:
+            orchestrator.graph = _compiled_graph(orchestrator)
+            print(f"✅ 场景 {scenario_id} 状态图已编译")
+        except Exception as e:
+            print(f"⚠️  场景 {scenario_id} 状态图编译失败: {e}")
@@ -6,10 +6,50 @@ Categories: company, product_faq, policy, new_release
 """
 from __future__ import annotations
 
+import asyncio
+import heapq
 import json
+import math
 import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
 from typing import List, Dict, Optional
 
+import orjson
+
+
+# delay before writing add_entry changes to disk, so bursts share one write
+FLUSH_DEBOUNCE_SECONDS = 0.5
+
+# Okapi BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# how many BM25 candidates (x top_k) get the phrase-contains check
+PHRASE_RERANK_FACTOR = 3
+
+
+# latin words, or runs of CJK characters (split into unigrams + bigrams by _tokenize)
+_TOKEN_RE = re.compile(r"[a-z0-9_]+|[\u4e00-\u9fff]+")
+_CJK_RE = re.compile(r"[\u4e00-\u9fff]")
+
+# _mtime before the first stat; a missing file is recorded as None so it is not re-checked as "changed"
+_NOT_LOADED = object()
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercase words plus CJK character unigrams and bigrams (so single-character queries still match)."""
+    tokens: List[str] = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.match(run) and len(run) > 1:
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
 
 class CSKnowledgeBase:
     def __init__(self, storage_path: str = "backend/data/cs_kb.json"):
@@ -20,27 +60,142 @@ class CSKnowledgeBase:
             "policy": [],
             "new_release": []
         }
+        # inverted index: token -> {flat entry position: term frequency}
+        self._token_index: Dict[str, Dict[int, int]] = {}
+        self._entries_flat: List[Dict] = []
+        self._texts: List[str] = []
+        # BM25 document statistics (token count per entry, running total)
+        self._doc_lens: List[int] = []
+        self._total_len = 0
+        # per-entry BM25 length normalisation, computed lazily and dropped whenever the corpus changes
+        self._doc_norms: Optional[List[float]] = None
+        # bumped whenever the indexed contents change, so callers can key caches on it
+        self.version = 0
+        # in-memory copy is authoritative; disk is flushed lazily
+        self._mtime: object = _NOT_LOADED
+        self._dirty = False
+        # set while a background flush is writing, so reload() does not re-read our own write
+        self._flushing = False
+        self._save_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._flush_task: Optional[asyncio.Task] = None
         self._load()
 
     def _load(self):
-        if os.path.exists(self.storage_path):
-            try:
-                with open(self.storage_path, "r", encoding="utf-8") as f:
-                    self._data = json.load(f)
-            except Exception:
-                pass
+        # skip re-parsing when the file is unchanged (or still missing), or when unflushed edits would be lost
+        if self._dirty or self._flushing:
+            return
+        try:
+            mtime = os.stat(self.storage_path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+
+        # a missing or unreadable file keeps the in-memory data; only rebuild when new data was read
+        if mtime is None:
+            return
+        try:
+            with open(self.storage_path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        except Exception:
+            return
+        self._build_index()
+
+    def _build_index(self):
+        """Rebuild the inverted index from self._data."""
+        self._token_index = {}
+        self._entries_flat = []
+        self._texts = []
+        self._doc_lens = []
+        self._total_len = 0
+        self._doc_norms = None
+        self.version += 1
+        for cat, items in self._data.items():
+            for it in items:
+                self._index_entry(it, cat)
+
+    def _index_entry(self, entry: Dict, category: str):
+        """Append one entry to the flat list and its tokens to the index."""
+        idx = len(self._entries_flat)
+        text = (entry.get("title", "") + "\n" + entry.get("content", "")).lower()
+        self._entries_flat.append({**entry, "category": category})
+        self._texts.append(text)
+        tokens = _tokenize(text)
+        for token, tf in Counter(tokens).items():
+            self._token_index.setdefault(token, {})[idx] = tf
+        self._doc_lens.append(len(tokens))
+        self._total_len += len(tokens)
+        self._doc_norms = None
+        self.version += 1
+
+    def _get_doc_norms(self) -> List[float]:
+        """BM25 length normalisation per entry; depends on avgdl, so it is rebuilt after edits."""
+        if self._doc_norms is None:
+            n_docs = len(self._doc_lens)
+            avgdl = (self._total_len / n_docs) if n_docs else 0.0
+            self._doc_norms = [
+                BM25_K1 * (1.0 - BM25_B + BM25_B * dl / avgdl) if avgdl else BM25_K1 * (1.0 - BM25_B)
+                for dl in self._doc_lens
+            ]
+        return self._doc_norms
 
     def _save(self):
-        os.makedirs(os.path.dirname(self.storage_path), exist_ok=True)
-        with open(self.storage_path, "w", encoding="utf-8") as f:
-            json.dump(self._data, f, ensure_ascii=False, indent=2)
+        # clear the flag before encoding: an add_entry that lands during the write marks it dirty again
+        self._dirty = False
+        try:
+            payload = orjson.dumps(self._data, option=orjson.OPT_INDENT_2)
+            # write to a temp file and swap it in, so readers never see a partial file
+            os.makedirs(os.path.dirname(self.storage_path), exist_ok=True)
+            tmp_path = self.storage_path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self.storage_path)
+            self._mtime = os.stat(self.storage_path).st_mtime
+        except Exception:
+            self._dirty = True
+            raise
+        self._last_flush = time.monotonic()
+
+    def _schedule_flush(self):
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no event loop (scripts / tests): write through
+            self._save()
+            return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_debounced())
+
+    async def _flush_debounced(self):
+        await asyncio.sleep(FLUSH_DEBOUNCE_SECONDS)
+        # encode + write off the event loop; loop again if entries were added meanwhile
+        while self._dirty:
+            self._flushing = True
+            try:
+                await asyncio.to_thread(self.flush)
+            finally:
+                self._flushing = False
+
+    def flush(self):
+        """Write pending changes to disk immediately."""
+        with self._save_lock:
+            if self._dirty:
+                self._save()
+
+    def reload(self):
+        """Re-read the storage file if it changed on disk."""
+        self._load()
 
     def add_entry(self, category: str, title: str, content: str) -> Dict:
         if category not in self._data:
             raise ValueError("invalid category")
         entry = {"id": f"KB_{len(self._data[category]) + 1}", "title": title, "content": content}
         self._data[category].append(entry)
-        self._save()
+        self._index_entry(entry, category)
+        self._schedule_flush()
         return entry
 
     def list_entries(self, category: Optional[str] = None) -> List[Dict]:
@@ -54,19 +209,42 @@ class CSKnowledgeBase:
         return result
 
     def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        # naive keyword match for demo
-        corpus = self.list_entries()
+        # Okapi BM25 over the inverted index; only entries sharing a query token are scored
+        q = query.lower().strip()
+        if not q:
+            return []
+
+        tokens = _tokenize(q)
         scored = []
-        q = query.lower()
-        for it in corpus:
-            text = (it.get("title", "") + "\n" + it.get("content", "")).lower()
-            score = text.count(q) if q else 0
-            if q and q in text:
-                score += 1
-            if score > 0:
-                scored.append((score, it))
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [it for _, it in scored[:top_k]]
+        if tokens:
+            n_docs = len(self._entries_flat)
+            norms = self._get_doc_norms()
+            scores: Dict[int, float] = defaultdict(float)
+            for token in set(tokens):
+                postings = self._token_index.get(token)
+                if not postings:
+                    continue
+                idf = math.log((n_docs - len(postings) + 0.5) / (len(postings) + 0.5) + 1.0)
+                for idx, tf in postings.items():
+                    scores[idx] += idf * tf * (BM25_K1 + 1.0) / (tf + norms[idx])
+            scored = [(score, idx) for idx, score in scores.items()]
+
+        if not scored:
+            # no indexable tokens (e.g. punctuation only) or no posting hit: fall back to a phrase scan
+            scored = [(text.count(q), idx) for idx, text in enumerate(self._texts) if q in text]
+            top = heapq.nlargest(top_k, scored, key=lambda x: x[0])
+            return [dict(self._entries_flat[idx]) for _, idx in top]
+
+        # phrase-contains bonus, checked on the top candidates only: entries containing the
+        # whole query get the best BM25 score added, so they rank ahead of partial matches
+        candidates = heapq.nlargest(top_k * PHRASE_RERANK_FACTOR, scored, key=lambda x: x[0])
+        bonus = candidates[0][0]
+        reranked = [
+            (score + bonus if q in self._texts[idx] else score, idx)
+            for score, idx in candidates
+        ]
+        top = heapq.nlargest(top_k, reranked, key=lambda x: x[0])
+        return [dict(self._entries_flat[idx]) for _, idx in top]
 
 
 # singleton
@@ -77,6 +255,9 @@ def get_cs_kb() -> CSKnowledgeBase:
     global _kb_instance
     if _kb_instance is None:
         _kb_instance = CSKnowledgeBase()
+    else:
+        # cheap mtime check; only re-parses when the file was edited externally
+        _kb_instance.reload()
     return _kb_instance
 
 
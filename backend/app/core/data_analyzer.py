@@ -2,12 +2,133 @@
 Data Analyzer - S6数据分析核心
 负责收集、分析各场景数据，生成分析报告
 """
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import atexit
 import json
 import os
+import tempfile
+import threading
+import time
 from pathlib import Path
 
+import numpy as np
+import orjson
+
+
+# 每个场景保留的metrics历史条数
+METRICS_HISTORY_LIMIT = 100
+# metrics文件为JSONL（每行一条，只追加）；行数超过该值时重写为最近 METRICS_HISTORY_LIMIT 行
+METRICS_COMPACT_LINES = 2 * METRICS_HISTORY_LIMIT
+# 从文件末尾倒序读取时每次读取的字节数
+_TAIL_BLOCK_SIZE = 64 * 1024
+# 趋势计算使用的最近记录条数
+TREND_WINDOW = 5
+# S3参与趋势计算的指标（矩阵的列）
+S3_TREND_METRICS = ("satisfaction_rate", "complaint_rate", "avg_response_time")
+# S3告警规则：(指标, 上限, 下限, 告警级别, 提示文案)，不检查的一侧用 None
+S3_ALERT_RULES = (
+    ("complaint_rate", 0.1, None, "high", "投诉率过高"),
+    ("satisfaction_rate", None, 0.8, "medium", "满意度偏低"),
+)
+# metrics先缓存在内存，攒够条数或距上次写文件超过间隔（秒）时再合并写入
+METRICS_FLUSH_BATCH = 50
+METRICS_FLUSH_INTERVAL = 5.0
+
+
+def _write_bytes_atomic(path: Path, content: bytes):
+    """
+    先写临时文件再原子替换，进程中途退出也不会留下半个文件
+
+    每次写入使用唯一的临时文件名，多个线程同时写同一文件时不会互相覆盖或移走对方的临时文件
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _write_json_atomic(path: Path, data: Dict):
+    """写入紧凑JSON（原子替换）"""
+    _write_bytes_atomic(path, orjson.dumps(data))
+
+
+def _jsonl(records: List[Dict]) -> bytes:
+    return b"".join(orjson.dumps(r) + b"\n" for r in records)
+
+
+def _metrics_matrix(records: List[Dict], keys: tuple) -> np.ndarray:
+    """把记录按指标组成 (K, M) 的float64矩阵，缺失值为NaN"""
+    return np.array(
+        [[np.nan if r.get(k) is None else float(r[k]) for k in keys] for r in records],
+        dtype=np.float64
+    ).reshape(len(records), len(keys))
+
+
+def _scan_thresholds(matrix: np.ndarray, hi: np.ndarray, lo: np.ndarray) -> np.ndarray:
+    """
+    对 (K, M) 指标矩阵按列做阈值扫描
+
+    Returns:
+        (K, M) int8：1 表示超过上限，-1 表示低于下限，0 表示正常（NaN不触发）
+    """
+    flags = np.zeros(matrix.shape, dtype=np.int8)
+    flags[matrix > hi] = 1
+    flags[matrix < lo] = -1
+    return flags
+
+
+def _trend_stats(records: List[Dict], keys: tuple) -> Dict[str, Dict[str, float]]:
+    """
+    把最近的记录按指标组成 (K, M) 矩阵，一次沿axis=0算出每个指标的均值、标准差和变化量
+
+    Returns:
+        {指标名: {"avg": 均值, "std": 标准差, "change": 最后一条减第一条}}
+    """
+    if not records:
+        return {k: {"avg": 0.0, "std": 0.0, "change": 0.0} for k in keys}
+    matrix = np.nan_to_num(_metrics_matrix(records, keys))
+    avg = matrix.mean(axis=0)
+    std = matrix.std(axis=0)
+    change = matrix[-1] - matrix[0]
+    return {
+        k: {"avg": float(avg[i]), "std": float(std[i]), "change": float(change[i])}
+        for i, k in enumerate(keys)
+    }
+
+
+# 告警规则对应的阈值向量（未设置的一侧取 ±inf，永不触发）
+_S3_ALERT_HI = np.array([np.inf if r[1] is None else r[1] for r in S3_ALERT_RULES], dtype=np.float64)
+_S3_ALERT_LO = np.array([-np.inf if r[2] is None else r[2] for r in S3_ALERT_RULES], dtype=np.float64)
+
+
+def _tail_lines(path: Path, limit: int) -> List[bytes]:
+    """从文件末尾倒序读取最后limit个非空行，不读整个文件"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        while pos > 0 and data.count(b"\n") <= limit:
+            step = min(_TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.split(b"\n")
+    if pos > 0:
+        # 第一行可能只读到一半
+        lines = lines[1:]
+    return [line for line in lines if line.strip()][-limit:]
+
 
 class DataAnalyzer:
     """S6数据分析器 - 企业数据中台"""
@@ -16,19 +137,39 @@ class DataAnalyzer:
         self.data_dir = Path(__file__).parent.parent.parent / "data"
         self.data_dir.mkdir(exist_ok=True)
 
-        # 各场景metrics文件路径
+        # 各场景metrics文件路径（JSONL，每行一条记录）
         self.metrics_files = {
-            "s3_customer_service": self.data_dir / "s3_metrics.json",
-            "s1_marketing": self.data_dir / "s1_metrics.json",
-            "s2_sales": self.data_dir / "s2_metrics.json",
-            "s4_content": self.data_dir / "s4_metrics.json",
-            "s5_process": self.data_dir / "s5_metrics.json",
-            "s7_compliance": self.data_dir / "s7_metrics.json"
+            "s3_customer_service": self.data_dir / "s3_metrics.jsonl",
+            "s1_marketing": self.data_dir / "s1_metrics.jsonl",
+            "s2_sales": self.data_dir / "s2_metrics.jsonl",
+            "s4_content": self.data_dir / "s4_metrics.jsonl",
+            "s5_process": self.data_dir / "s5_metrics.jsonl",
+            "s7_compliance": self.data_dir / "s7_metrics.jsonl"
         }
 
         # 分析报告存储路径
         self.report_file = self.data_dir / "s6_analysis_report.json"
 
+        # metrics文件是读-改-写，多线程同时上报时需串行
+        self._metrics_lock = threading.Lock()
+        # 报告的生成和过期检查串行执行：报告过期时并发请求只重新生成一次
+        self._report_lock = threading.RLock()
+        # 尚未写入文件的metrics，以及各场景上次写文件的时间
+        self._buffers: Dict[str, List[Dict]] = {}
+        self._last_flush: Dict[str, float] = {}
+        # 各场景metrics文件的当前行数（首次写入时统计）
+        self._line_counts: Dict[str, int] = {}
+        # 已检查过旧版JSON文件的场景
+        self._migrated: set = set()
+        # 进程退出时写回缓存中的metrics
+        atexit.register(self.flush)
+
+        # 各场景分析函数（互不依赖，综合报告时并发执行）
+        # TODO: 分析其他场景（S1, S2, S4, S5, S7），实现后在这里注册即可
+        self.scenario_analyzers: Dict[str, Callable[[], Dict]] = {
+            "s3_customer_service": self.analyze_s3_customer_service
+        }
+
     def collect_metrics(self, scenario: str, metrics: Dict):
         """
         收集场景metrics数据
@@ -42,37 +183,105 @@ class DataAnalyzer:
             print(f"⚠️  未知场景: {scenario}")
             return
 
-        # 加载现有数据
-        if file_path.exists():
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        else:
-            data = {"history": []}
-
         # 添加时间戳
         metrics["timestamp"] = datetime.now().isoformat()
 
-        # 追加新数据
-        data["history"].append(metrics)
-
-        # 保留最近100条记录
-        if len(data["history"]) > 100:
-            data["history"] = data["history"][-100:]
-
-        # 保存
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        with self._metrics_lock:
+            buffer = self._buffers.setdefault(scenario, [])
+            buffer.append(metrics)
+            # 写文件持续失败时缓存也只保留最近的记录
+            if len(buffer) > METRICS_HISTORY_LIMIT:
+                del buffer[:-METRICS_HISTORY_LIMIT]
+            if (
+                len(buffer) >= METRICS_FLUSH_BATCH
+                or time.monotonic() - self._last_flush.get(scenario, 0.0) >= METRICS_FLUSH_INTERVAL
+            ):
+                self._flush_locked(scenario)
 
         print(f"✅ S6收集metrics: {scenario}")
 
+    def _migrate_legacy_locked(self, scenario: str):
+        """旧版 {"history": [...]} 格式的 .json 文件转换为 JSONL（每个场景只检查一次）"""
+        if scenario in self._migrated:
+            return
+        self._migrated.add(scenario)
+        file_path = self.metrics_files[scenario]
+        legacy_path = file_path.with_suffix(".json")
+        if file_path.exists() or not legacy_path.exists():
+            return
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            history = json.load(f).get("history", [])
+        _write_bytes_atomic(file_path, _jsonl(history[-METRICS_HISTORY_LIMIT:]))
+        os.remove(legacy_path)
+        print(f"✅ S6 metrics已转换为JSONL: {file_path.name}")
+
+    def _read_history(self, scenario: str) -> List[Dict]:
+        """读取文件中最近 METRICS_HISTORY_LIMIT 条记录（调用方持有 _metrics_lock）"""
+        self._migrate_legacy_locked(scenario)
+        file_path = self.metrics_files[scenario]
+        if not file_path.exists():
+            return []
+        history = []
+        for line in _tail_lines(file_path, METRICS_HISTORY_LIMIT):
+            try:
+                history.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                # 进程中途退出可能留下半行，跳过
+                continue
+        return history
+
+    def _flush_locked(self, scenario: str):
+        """把缓存的metrics追加写入文件（调用方持有 _metrics_lock）"""
+        buffer = self._buffers.get(scenario)
+        self._last_flush[scenario] = time.monotonic()
+        if not buffer:
+            return
+        self._migrate_legacy_locked(scenario)
+        file_path = self.metrics_files[scenario]
+
+        line_count = self._line_counts.get(scenario)
+        if line_count is None:
+            line_count = 0
+            if file_path.exists():
+                with open(file_path, "rb") as f:
+                    line_count = sum(1 for _ in f)
+
+        with open(file_path, "ab") as f:
+            f.write(_jsonl(buffer))
+        line_count += len(buffer)
+        buffer.clear()
+
+        # 文件过长时只保留最近100条记录
+        if line_count > METRICS_COMPACT_LINES:
+            lines = _tail_lines(file_path, METRICS_HISTORY_LIMIT)
+            _write_bytes_atomic(file_path, b"".join(line + b"\n" for line in lines))
+            line_count = len(lines)
+        self._line_counts[scenario] = line_count
+
+    def flush(self):
+        """写回所有场景缓存中的metrics"""
+        with self._metrics_lock:
+            for scenario in list(self._buffers):
+                try:
+                    self._flush_locked(scenario)
+                except Exception as e:
+                    print(f"⚠️  S6写入metrics失败: {scenario}: {e}")
+
     def load_scenario_metrics(self, scenario: str) -> Optional[Dict]:
-        """加载场景metrics"""
+        """加载场景metrics（包含尚未写入文件的部分）"""
         file_path = self.metrics_files.get(scenario)
-        if not file_path or not file_path.exists():
+        if not file_path:
             return None
 
-        with open(file_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with self._metrics_lock:
+            history = self._read_history(scenario)
+            buffer = self._buffers.get(scenario)
+            if buffer:
+                history.extend(buffer)
+            if not history and not file_path.exists():
+                return None
+
+        return {"history": history[-METRICS_HISTORY_LIMIT:]}
 
     def analyze_s3_customer_service(self) -> Dict:
         """分析S3客服数据"""
@@ -88,24 +297,18 @@ class DataAnalyzer:
         # 获取最新数据
         latest = data["history"][-1]
 
-        # 计算趋势（最近5条记录）
-        recent = data["history"][-5:]
-        satisfaction_trend = [r.get("satisfaction_rate", 0) for r in recent]
-        avg_satisfaction = sum(satisfaction_trend) / len(satisfaction_trend)
-
-        # 异常检测
-        alerts = []
-        if latest.get("complaint_rate", 0) > 0.1:
-            alerts.append({
-                "level": "high",
-                "message": f"投诉率过高: {latest.get('complaint_rate', 0) * 100:.1f}%"
-            })
-
-        if latest.get("satisfaction_rate", 1) < 0.8:
-            alerts.append({
-                "level": "medium",
-                "message": f"满意度偏低: {latest.get('satisfaction_rate', 0) * 100:.1f}%"
-            })
+        # 计算趋势（最近5条记录，各指标一次性向量化计算）
+        stats = _trend_stats(data["history"][-TREND_WINDOW:], S3_TREND_METRICS)
+        satisfaction = stats["satisfaction_rate"]
+
+        # 异常检测：对最新记录按规则表一次性扫描阈值
+        keys = tuple(rule[0] for rule in S3_ALERT_RULES)
+        flags = _scan_thresholds(_metrics_matrix([latest], keys), _S3_ALERT_HI, _S3_ALERT_LO)[-1]
+        alerts = [
+            {"level": level, "message": f"{label}: {latest.get(key, 0) * 100:.1f}%"}
+            for (key, _, _, level, label), flag in zip(S3_ALERT_RULES, flags)
+            if flag
+        ]
 
         return {
             "scenario": "s3_customer_service",
@@ -117,8 +320,13 @@ class DataAnalyzer:
                 "avg_response_time": latest.get("avg_response_time", 0)
             },
             "trends": {
-                "satisfaction_avg": avg_satisfaction,
-                "satisfaction_change": satisfaction_trend[-1] - satisfaction_trend[0] if len(satisfaction_trend) > 1 else 0
+                "satisfaction_avg": satisfaction["avg"],
+                "satisfaction_change": satisfaction["change"],
+                "satisfaction_std": satisfaction["std"],
+                "complaint_avg": stats["complaint_rate"]["avg"],
+                "complaint_change": stats["complaint_rate"]["change"],
+                "response_time_avg": stats["avg_response_time"]["avg"],
+                "response_time_change": stats["avg_response_time"]["change"]
             },
             "alerts": alerts,
             "updated_at": latest.get("timestamp")
@@ -126,24 +334,30 @@ class DataAnalyzer:
 
     def analyze_all_scenarios(self) -> Dict:
         """分析所有场景数据，生成综合报告"""
+        with self._report_lock:
+            return self._analyze_all_scenarios_locked()
+
+    def _analyze_all_scenarios_locked(self) -> Dict:
         report = {
             "report_id": f"report_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
             "generated_at": datetime.now().isoformat(),
             "scenarios": {}
         }
 
-        # 分析S3客服
-        report["scenarios"]["s3_customer_service"] = self.analyze_s3_customer_service()
-
-        # TODO: 分析其他场景（S1, S2, S4, S5, S7）
-        # 目前先实现S3，其他场景可以后续添加
+        # 各场景分析（读各自的metrics文件）互不依赖：多个场景时在线程池中并发执行
+        names = list(self.scenario_analyzers)
+        if len(names) > 1:
+            with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="s6-analyze") as pool:
+                results = list(pool.map(lambda name: self.scenario_analyzers[name](), names))
+        else:
+            results = [self.scenario_analyzers[name]() for name in names]
+        report["scenarios"] = dict(zip(names, results))
 
-        # 生成总体洞察
+        # 所有场景分析完成后生成总体洞察
         report["insights"] = self._generate_insights(report["scenarios"])
 
         # 保存报告
-        with open(self.report_file, "w", encoding="utf-8") as f:
-            json.dump(report, f, ensure_ascii=False, indent=2)
+        _write_json_atomic(self.report_file, report)
 
         print(f"✅ S6生成分析报告: {report['report_id']}")
 
@@ -186,20 +400,22 @@ class DataAnalyzer:
 
     def get_latest_report(self) -> Optional[Dict]:
         """获取最新分析报告"""
-        if not self.report_file.exists():
-            # 如果没有报告，生成一个
-            return self.analyze_all_scenarios()
-
-        with open(self.report_file, "r", encoding="utf-8") as f:
-            report = json.load(f)
-
-        # 检查报告是否过期（超过5分钟）
-        generated_at = datetime.fromisoformat(report["generated_at"])
-        if datetime.now() - generated_at > timedelta(minutes=5):
-            # 重新生成报告
-            return self.analyze_all_scenarios()
-
-        return report
+        # 在锁内读取并检查是否过期：等锁期间其他请求可能已经重新生成
+        with self._report_lock:
+            if not self.report_file.exists():
+                # 如果没有报告，生成一个
+                return self._analyze_all_scenarios_locked()
+
+            with open(self.report_file, "r", encoding="utf-8") as f:
+                report = json.load(f)
+
+            # 检查报告是否过期（超过5分钟）
+            generated_at = datetime.fromisoformat(report["generated_at"])
+            if datetime.now() - generated_at > timedelta(minutes=5):
+                # 重新生成报告
+                return self._analyze_all_scenarios_locked()
+
+            return report
 
     def get_scenario_summary(self, scenario: str) -> Dict:
         """获取单个场景摘要"""
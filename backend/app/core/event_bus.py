@@ -2,10 +2,27 @@
 Event Bus - 事件总线
 用于Agent之间的事件驱动通信
 """
-from typing import Callable, Dict, List, Any
+from typing import Callable, Deque, Dict, List, Any, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
 import asyncio
+import logging
+import os
+import threading
 from datetime import datetime
-import json
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# 队列订阅者的默认队列长度，满了丢弃最旧的一条
+QUEUE_SUBSCRIBER_SIZE = 256
+
+# 事件ID：进程启动随机前缀 + 进程内单调递增序号。不依赖时钟精度（Windows上约15.6ms），
+# 断线重放按ID定位时不会出现重复；重启后前缀不同，旧ID不会误匹配到新事件
+_BOOT_ID = os.urandom(4).hex()
+_event_seq = count(1)
 
 
 class Event:
@@ -15,7 +32,17 @@ class Event:
         self.data = data
         self.source = source
         self.timestamp = datetime.now().isoformat()
-        self.id = f"EVT_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        self.id = f"EVT_{_BOOT_ID}_{next(_event_seq)}"
+        self._payload: Optional[str] = None
+
+    def payload(self) -> str:
+        """推送给队列订阅者的JSON文本（首次调用时编码，之后所有订阅者和断线重放共用）"""
+        if self._payload is None:
+            self._payload = orjson.dumps(
+                {"type": self.name, "data": self.data, "id": self.id},
+                option=orjson.OPT_NON_STR_KEYS
+            ).decode()
+        return self._payload
 
     def to_dict(self) -> Dict:
         return {
@@ -31,9 +58,20 @@ class EventBus:
     """事件总线 - 支持异步事件分发"""
 
     def __init__(self):
-        self.subscribers: Dict[str, List[Callable]] = {}
-        self.event_history: List[Event] = []
-        self.max_history = 100
+        # event_name -> {回调: 是否为协程函数}，按订阅顺序分发；同一回调重复订阅只保留一份
+        self.subscribers: Dict[str, Dict[Callable, bool]] = {}
+        # event_name -> 队列订阅者（dict当作有序集合），事件编码一次后直接入队，不等待消费
+        self.queue_subscribers: Dict[str, Dict[asyncio.Queue, None]] = {}
+        self.queue_dropped = 0  # 队列订阅者消费太慢被丢弃的事件数
+        # 同时作为断线重连时补发事件的缓冲区
+        self.max_history = 1000
+        # 定长环形缓冲，超出上限时自动淘汰最旧的事件
+        self.event_history: Deque[Event] = deque(maxlen=self.max_history)
+        # 同步回调专用线程池（线程按需创建），数量可通过 EVENT_BUS_THREADS 配置
+        self._executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("EVENT_BUS_THREADS", "16")),
+            thread_name_prefix="evbus"
+        )
 
     def subscribe(self, event_name: str, callback: Callable):
         """
@@ -43,16 +81,76 @@ class EventBus:
             event_name: 事件名称
             callback: 回调函数（支持异步）
         """
-        if event_name not in self.subscribers:
-            self.subscribers[event_name] = []
-
-        self.subscribers[event_name].append(callback)
-        print(f"✅ 订阅事件: {event_name} -> {callback.__name__}")
+        self.subscribers.setdefault(event_name, {})[callback] = asyncio.iscoroutinefunction(callback)
+        logger.debug("✅ 订阅事件: %s -> %s", event_name, getattr(callback, "__name__", callback))
 
     def unsubscribe(self, event_name: str, callback: Callable):
         """取消订阅"""
-        if event_name in self.subscribers:
-            self.subscribers[event_name].remove(callback)
+        subscribers = self.subscribers.get(event_name)
+        if subscribers:
+            subscribers.pop(callback, None)
+
+    def subscribe_queue(
+        self,
+        event_names: List[str],
+        maxsize: int = QUEUE_SUBSCRIBER_SIZE,
+        last_event_id: Optional[str] = None
+    ) -> asyncio.Queue:
+        """
+        以队列方式订阅多个事件
+
+        每个事件编码一次为JSON文本 {"type": 事件名, "data": 事件数据, "id": 事件ID}，放入所有订阅队列；
+        队列满时丢弃最旧的一条。不再使用时调用 drop_queue
+
+        Args:
+            event_names: 事件名称列表
+            maxsize: 队列长度
+            last_event_id: 断线重连时客户端收到的最后一个事件ID，
+                历史中在它之后的同名事件会先放入队列（补发后无缝衔接实时事件）
+
+        Returns:
+            事件队列
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        # 补发与订阅之间没有await，不会漏掉或重复事件
+        if last_event_id:
+            for event in self._events_after(last_event_id, event_names)[-maxsize:]:
+                queue.put_nowait(event.payload())
+        for event_name in event_names:
+            self.queue_subscribers.setdefault(event_name, {})[queue] = None
+        return queue
+
+    def _events_after(self, last_event_id: str, event_names: List[str]) -> List[Event]:
+        """历史中 last_event_id 之后的指定事件；ID已不在历史中时返回空列表（无法确定断点）"""
+        missed: List[Event] = []
+        for event in reversed(self.event_history):
+            if event.id == last_event_id:
+                missed.reverse()
+                return missed
+            if event.name in event_names:
+                missed.append(event)
+        return []
+
+    def drop_queue(self, queue: asyncio.Queue):
+        """取消队列订阅"""
+        for queues in self.queue_subscribers.values():
+            queues.pop(queue, None)
+
+    def _publish_to_queues(self, event: Event):
+        queues = self.queue_subscribers.get(event.name)
+        if not queues:
+            return
+        try:
+            payload = event.payload()
+        except TypeError:
+            logger.exception("❌ 事件数据无法序列化，未推送给队列订阅者: %s", event.name)
+            return
+        for queue in queues:
+            if queue.full():
+                queue.get_nowait()
+                self.queue_dropped += 1
+                logger.warning("⚠️ 事件队列已满，丢弃最旧事件（累计丢弃 %d 条）", self.queue_dropped)
+            queue.put_nowait(payload)
 
     async def emit(self, event_name: str, data: Dict[str, Any], source: str = "unknown"):
         """
@@ -67,51 +165,71 @@ class EventBus:
 
         # 记录历史
         self.event_history.append(event)
-        if len(self.event_history) > self.max_history:
-            self.event_history.pop(0)
 
-        print(f"📡 触发事件: {event_name} | 来源: {source}")
+        logger.debug("📡 触发事件: %s | 来源: %s", event_name, source)
+
+        # 队列订阅者直接入队
+        self._publish_to_queues(event)
 
         # 分发给订阅者
-        if event_name in self.subscribers:
+        subscribers = self.subscribers.get(event_name)
+        if subscribers:
+            loop = asyncio.get_running_loop()
             tasks = []
-            for callback in self.subscribers[event_name]:
+            for callback, is_coro in subscribers.items():
                 # 支持同步和异步回调
-                if asyncio.iscoroutinefunction(callback):
+                if is_coro:
                     tasks.append(callback(event.data))
                 else:
-                    # 同步函数包装为异步
-                    tasks.append(asyncio.to_thread(callback, event.data))
-
-            # 并发执行所有订阅者
-            if tasks:
-                await asyncio.gather(*tasks, return_exceptions=True)
+                    # 同步函数放到事件总线线程池执行
+                    tasks.append(loop.run_in_executor(self._executor, callback, event.data))
+
+            # 单个订阅者直接等待，多个订阅者并发执行；订阅者异常只记录日志，不影响其他订阅者
+            if len(tasks) == 1:
+                try:
+                    await tasks[0]
+                except Exception:
+                    logger.exception("❌ 事件订阅者执行失败: %s", event_name)
+            else:
+                results = await asyncio.gather(*tasks, return_exceptions=True)
+                for result in results:
+                    if isinstance(result, Exception):
+                        logger.error("❌ 事件订阅者执行失败: %s", event_name, exc_info=result)
 
         return event.id
 
     def get_event_history(self, event_name: str = None, limit: int = 10) -> List[Dict]:
-        """获取事件历史"""
-        history = self.event_history
-
+        """获取事件历史（按时间正序，最多limit条）"""
+        # 从最新的事件往回取，取够limit条即停止
+        recent = reversed(self.event_history)
         if event_name:
-            history = [e for e in history if e.name == event_name]
+            recent = (e for e in recent if e.name == event_name)
 
-        return [e.to_dict() for e in history[-limit:]]
+        history = list(islice(recent, limit))
+        history.reverse()
+        return [e.to_dict() for e in history]
 
     def clear_history(self):
         """清空历史"""
         self.event_history.clear()
 
+    def shutdown(self):
+        """关闭同步回调线程池"""
+        self._executor.shutdown(wait=False)
+
 
 # 全局单例
 _event_bus_instance = None
+_event_bus_lock = threading.Lock()
 
 
 def get_event_bus() -> EventBus:
     """获取事件总线单例"""
     global _event_bus_instance
     if _event_bus_instance is None:
-        _event_bus_instance = EventBus()
+        with _event_bus_lock:
+            if _event_bus_instance is None:
+                _event_bus_instance = EventBus()
     return _event_bus_instance
 
 
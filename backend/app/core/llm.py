@@ -2,23 +2,89 @@
 LLM Client - OpenAI封装
 支持流式和非流式调用
 """
-from typing import List, Dict, Optional, AsyncGenerator
+from typing import Callable, List, Dict, Optional, AsyncGenerator, Sequence, Tuple
+from collections import OrderedDict
 import openai
 from openai import OpenAI, AsyncOpenAI
+import asyncio
+import hashlib
+import httpx
+import json
 import os
+import re
+import time
+import orjson
+
+from app.core.response_cache import SemanticResponseCache
+
+# 共享HTTP连接池：所有异步LLM请求复用长连接，省去每次的TCP/TLS握手
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "400"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "200"))
+# 空闲长连接保留时间（秒）
+LLM_KEEPALIVE_EXPIRY = 60.0
+
+# 语义缓存的回复有效期（秒）
+COMPLETION_CACHE_TTL = 900.0
+
+# 流式文本合并：缓冲达到该字符数或距上次产出超过该间隔（秒）时才产出一个content包
+STREAM_COALESCE_CHARS = int(os.getenv("LLM_STREAM_COALESCE_CHARS", "32"))
+STREAM_COALESCE_INTERVAL = 0.02
+
+# 精确缓存：请求参数和消息完全相同的低温度调用直接复用结果
+EXACT_CACHE_SIZE = 512
+EXACT_CACHE_TTL = 600.0
+# 温度高于该值的调用期望每次输出不同，不走精确缓存
+EXACT_CACHE_MAX_TEMPERATURE = 0.2
+# 规范化命中：其余消息完全相同、最后一条用户消息合并空白、去掉首尾空白和句末标点、统一小写后完全相同时复用精确缓存
+# （不做相似度匹配，也不去掉句中标点：模板化提示词大部分文本固定，改一两个字、
+# 一个小数点或负号就可能是相反的意思）
+FUZZY_CACHE_SIZE = 256
+# 句末可忽略的标点
+_TRAILING_PUNCT = "。！？!?.，,；;…~～ "
 
 
 class LLMClient:
     """LLM客户端封装（支持OpenAI/DeepSeek多模式切换+自动降级）"""
 
-    def __init__(self, api_key: Optional[str] = None, model: str = "gpt-4"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        model: str = "gpt-4",
+        cache_threshold: float = 0.92,
+        cache_max_entries: int = 1024
+    ):
         """
         初始化LLM客户端
 
         Args:
             api_key: API Key（可选，会自动根据模式选择）
             model: 模型名称（可选，会自动根据模式选择）
+            cache_threshold: 语义缓存命中的余弦相似度阈值
+            cache_max_entries: 语义缓存最大条数
         """
+        # 语义缓存：调用方通过 semantic_text 声明"结果只取决于这段文本"时才使用
+        self._completion_cache = SemanticResponseCache(
+            capacity=cache_max_entries,
+            ttl=COMPLETION_CACHE_TTL,
+            threshold=cache_threshold
+        )
+        # 文本向量函数（同步），由 set_embedder 注入；未注入时只做精确命中
+        self._embed: Optional[Callable[[str], Optional[Sequence[float]]]] = None
+        # 精确缓存: sha256(模型, 温度, max_tokens, 消息) -> (过期时间, 响应)
+        self._exact_cache: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        # 最近写入精确缓存的请求：规范化键 -> 精确缓存键
+        self._fuzzy_index: "OrderedDict[str, str]" = OrderedDict()
+        self.cache_stats = {"exact_hits": 0, "fuzzy_hits": 0, "semantic_hits": 0, "misses": 0}
+
+        # OpenAI和DeepSeek的异步客户端共用一个连接池（按域名分别保持长连接）
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+            )
+        )
+
         # 🔧 读取LLM模式（auto | openai | deepseek）
         self.llm_mode = os.getenv("LLM_MODE", "auto").lower()
 
@@ -37,7 +103,10 @@ class LLMClient:
 
             # 初始化OpenAI客户端
             if self.openai_api_key:
-                self.openai_async_client = AsyncOpenAI(api_key=self.openai_api_key)
+                self.openai_async_client = AsyncOpenAI(
+                    api_key=self.openai_api_key,
+                    http_client=self._http_client
+                )
                 print(f"  ✅ OpenAI ({self.openai_model}) 已就绪")
             else:
                 self.openai_async_client = None
@@ -47,7 +116,8 @@ class LLMClient:
             if self.deepseek_api_key:
                 self.deepseek_async_client = AsyncOpenAI(
                     api_key=self.deepseek_api_key,
-                    base_url="https://api.deepseek.com/v1"
+                    base_url="https://api.deepseek.com/v1",
+                    http_client=self._http_client
                 )
                 print(f"  ✅ DeepSeek ({self.deepseek_model}) 已就绪（兜底）")
             else:
@@ -67,7 +137,11 @@ class LLMClient:
             print(f"🌐 LLM模式: DeepSeek ({self.model}) - 国内直连")
 
             if self.api_key:
-                self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+                self.async_client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    http_client=self._http_client
+                )
             else:
                 self.async_client = None
                 print(f"⚠️  警告: DeepSeek API Key未设置")
@@ -80,7 +154,7 @@ class LLMClient:
             print(f"🌐 LLM模式: OpenAI ({self.model})")
 
             if self.api_key:
-                self.async_client = AsyncOpenAI(api_key=self.api_key)
+                self.async_client = AsyncOpenAI(api_key=self.api_key, http_client=self._http_client)
             else:
                 self.async_client = None
                 print(f"⚠️  警告: OpenAI API Key未设置")
@@ -94,6 +168,32 @@ class LLMClient:
         else:
             self.client = None
 
+    def _async_clients(self) -> List[AsyncOpenAI]:
+        clients = [
+            getattr(self, "openai_async_client", None),
+            getattr(self, "deepseek_async_client", None),
+            self.async_client
+        ]
+        unique = []
+        for client in clients:
+            if client is not None and all(client is not c for c in unique):
+                unique.append(client)
+        return unique
+
+    async def prewarm(self):
+        """预热连接：启动时对每个服务商发一个轻量请求，提前完成TCP/TLS握手，首个对话请求直接复用长连接"""
+        results = await asyncio.gather(
+            *[client.models.list() for client in self._async_clients()],
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"⚠️  LLM连接预热失败: {result}")
+
+    async def aclose(self):
+        """关闭共享连接池"""
+        await self._http_client.aclose()
+
     def chat_completion(
         self,
         messages: List[Dict[str, str]],
@@ -121,7 +221,14 @@ class LLMClient:
                 "content": None
             }
 
+        exact_key = None if stream else self._exact_key(messages, model, temperature, max_tokens)
+        fuzzy_key = self._fuzzy_key(exact_key, messages, model, temperature, max_tokens)
+        cached_response = self._get_exact(exact_key) or self._get_fuzzy(fuzzy_key)
+        if cached_response is not None:
+            return cached_response
+
         try:
+            self.cache_stats["misses"] += 1
             response = self.client.chat.completions.create(
                 model=model or self.model,
                 messages=messages,
@@ -133,11 +240,13 @@ class LLMClient:
             if stream:
                 return {"stream": response}
             else:
-                return {
+                result = {
                     "content": response.choices[0].message.content,
                     "finish_reason": response.choices[0].finish_reason,
                     "usage": response.usage.model_dump() if response.usage else None
                 }
+                self._put_exact(exact_key, result, fuzzy_key)
+                return result
 
         except Exception as e:
             return {
@@ -145,12 +254,109 @@ class LLMClient:
                 "content": None
             }
 
+    def _exact_key(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> Optional[str]:
+        """精确缓存键；温度过高（期望随机输出）时返回None表示不缓存"""
+        if temperature > EXACT_CACHE_MAX_TEMPERATURE:
+            return None
+        payload = orjson.dumps(
+            [model or self.model, temperature, max_tokens, messages],
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    def _fuzzy_key(
+        self,
+        exact_key: Optional[str],
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> Optional[str]:
+        """
+        规范化缓存键：除最后一条外所有消息和参数原样参与，
+        最后一条用户消息合并连续空白、去掉首尾空白和句末标点、统一小写后参与
+
+        只吸收空白、句末标点、大小写这类不改变语义的差异；句中文字或标点不同都不会命中
+        """
+        if exact_key is None or not messages:
+            return None
+        last = messages[-1]
+        content = last.get("content")
+        if last.get("role") != "user" or not isinstance(content, str):
+            return None
+        canonical = " ".join(content.split()).rstrip(_TRAILING_PUNCT).lower()
+        payload = orjson.dumps(
+            [model or self.model, temperature, max_tokens, messages[:-1], canonical],
+            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    def _get_fuzzy(self, fuzzy_key: Optional[str]) -> Optional[Dict]:
+        """查找规范化后相同的最近请求的缓存回复"""
+        if fuzzy_key is None:
+            return None
+        exact_key = self._fuzzy_index.get(fuzzy_key)
+        if exact_key is None:
+            return None
+        return self._get_exact(exact_key, stat="fuzzy_hits")
+
+    def _get_exact(self, key: Optional[str], stat: str = "exact_hits") -> Optional[Dict]:
+        if key is None:
+            return None
+        entry = self._exact_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._exact_cache.pop(key, None)
+            return None
+        try:
+            self._exact_cache.move_to_end(key)
+        except KeyError:
+            pass
+        self.cache_stats[stat] += 1
+        return {**entry[1], "cached": True}
+
+    def _put_exact(
+        self,
+        key: Optional[str],
+        response: Dict,
+        fuzzy_key: Optional[str] = None
+    ):
+        if key is None or response.get("error") or not response.get("content"):
+            return
+        self._exact_cache[key] = (time.monotonic() + EXACT_CACHE_TTL, response)
+        # 同步接口可能在多个线程中调用，淘汰时容忍并发修改
+        while len(self._exact_cache) > EXACT_CACHE_SIZE:
+            try:
+                self._exact_cache.popitem(last=False)
+            except KeyError:
+                break
+        if fuzzy_key is not None:
+            self._fuzzy_index[fuzzy_key] = key
+            while len(self._fuzzy_index) > FUZZY_CACHE_SIZE:
+                try:
+                    self._fuzzy_index.popitem(last=False)
+                except KeyError:
+                    break
+
+    def set_embedder(self, embed: Callable[[str], Optional[Sequence[float]]]):
+        """注入文本向量函数（如 MemoryManager.embed_query），启用语义缓存"""
+        self._embed = embed
+
     async def async_chat_completion(
         self,
         messages: List[Dict[str, str]],
         model: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: Optional[int] = None
+        max_tokens: Optional[int] = None,
+        semantic_text: Optional[str] = None,
+        cache_scope: str = ""
     ) -> Dict:
         """
         异步调用OpenAI Chat Completion
@@ -160,10 +366,60 @@ class LLMClient:
             model: 模型名称（可选）
             temperature: 温度
             max_tokens: 最大token数
+            semantic_text: 结果只取决于这段文本时传入（如待分类的内容），
+                语义相近的文本直接复用缓存的回复；不传则不走语义缓存
+            cache_scope: 语义缓存作用域（如提示词模板名），只在同一作用域内命中
 
         Returns:
             响应结果
         """
+        exact_key = self._exact_key(messages, model, temperature, max_tokens)
+        fuzzy_key = self._fuzzy_key(exact_key, messages, model, temperature, max_tokens)
+        cached_response = self._get_exact(exact_key) or self._get_fuzzy(fuzzy_key)
+        if cached_response is not None:
+            return cached_response
+
+        if semantic_text is None:
+            self.cache_stats["misses"] += 1
+            response = await self._async_chat_completion(messages, model, temperature, max_tokens)
+            self._put_exact(exact_key, response, fuzzy_key)
+            return response
+
+        # 作用域包含模型参数，不同参数的回复互不复用
+        scope = f"{cache_scope}|{model or self.model}|{temperature}|{max_tokens}"
+        key = SemanticResponseCache.make_key("completion", semantic_text, scope)
+        # 相同文本先按键精确命中，不必计算向量
+        cached = self._completion_cache.get(key, None, scope)
+        if cached is not None:
+            self.cache_stats["semantic_hits"] += 1
+            return {"content": cached, "finish_reason": "stop", "usage": None, "cached": True}
+
+        embedding = None
+        if self._embed is not None:
+            try:
+                embedding = await asyncio.to_thread(self._embed, semantic_text)
+            except Exception as e:
+                print(f"⚠️  计算语义缓存向量失败: {e}")
+
+        cached = self._completion_cache.get(key, embedding, scope)
+        if cached is not None:
+            self.cache_stats["semantic_hits"] += 1
+            return {"content": cached, "finish_reason": "stop", "usage": None, "cached": True}
+
+        self.cache_stats["misses"] += 1
+        response = await self._async_chat_completion(messages, model, temperature, max_tokens)
+        if not response.get("error") and response.get("content"):
+            self._completion_cache.put(key, response["content"], embedding, scope)
+        self._put_exact(exact_key, response, fuzzy_key)
+        return response
+
+    async def _async_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> Dict:
         if not self.async_client:
             return {
                 "error": "OpenAI异步客户端未初始化",
@@ -319,14 +575,32 @@ class LLMClient:
             stream = await client.chat.completions.create(**kwargs)
 
             tool_calls_buffer = []  # 累积工具调用
+            # 工具参数分片先存列表，完成时一次join（避免长JSON参数反复字符串拼接）
+            args_parts: List[List[str]] = []
+            # 待产出的文本分片；首个分片立即产出，保证首字延迟不变
+            content_parts: List[str] = []
+            content_len = 0
+            loop = asyncio.get_running_loop()
+            last_yield = None
 
             async for chunk in stream:
                 delta = chunk.choices[0].delta
                 finish_reason = chunk.choices[0].finish_reason
 
-                # 文本内容
+                # 文本内容（按大小/时间合并后产出）
                 if delta.content:
-                    yield {"type": "content", "content": delta.content}
+                    content_parts.append(delta.content)
+                    content_len += len(delta.content)
+                    now = loop.time()
+                    if (
+                        last_yield is None
+                        or content_len >= STREAM_COALESCE_CHARS
+                        or now - last_yield >= STREAM_COALESCE_INTERVAL
+                    ):
+                        yield {"type": "content", "content": "".join(content_parts)}
+                        content_parts.clear()
+                        content_len = 0
+                        last_yield = now
 
                 # 工具调用
                 if delta.tool_calls:
@@ -340,6 +614,7 @@ class LLMClient:
                                 "type": "function",
                                 "function": {"name": "", "arguments": ""}
                             })
+                            args_parts.append([])
 
                         # 累积工具调用数据
                         if tool_call.id:
@@ -348,12 +623,20 @@ class LLMClient:
                             if tool_call.function.name:
                                 tool_calls_buffer[index]["function"]["name"] = tool_call.function.name
                             if tool_call.function.arguments:
-                                tool_calls_buffer[index]["function"]["arguments"] += tool_call.function.arguments
+                                args_parts[index].append(tool_call.function.arguments)
 
                 # 完成
                 if finish_reason:
+                    # 先产出剩余的文本
+                    if content_parts:
+                        yield {"type": "content", "content": "".join(content_parts)}
+                        content_parts.clear()
+                        content_len = 0
+
                     # 如果有工具调用，发送完整的工具调用数据
                     if tool_calls_buffer:
+                        for buffered, parts in zip(tool_calls_buffer, args_parts):
+                            buffered["function"]["arguments"] = "".join(parts)
                         yield {
                             "type": "tool_calls",
                             "tool_calls": tool_calls_buffer,
@@ -365,6 +648,10 @@ class LLMClient:
                         "finish_reason": finish_reason
                     }
 
+            # 流意外结束（没有finish_reason）时不丢弃缓冲的文本
+            if content_parts:
+                yield {"type": "content", "content": "".join(content_parts)}
+
         except Exception as e:
             raise e  # 向上抛出，由调用方处理
 
@@ -407,6 +694,37 @@ class LLMClient:
         return messages
 
 
+# LLM返回的JSON：优先取markdown代码块内的对象，否则取首尾大括号之间的内容
+_JSON_BLOCK_RE = re.compile(r"```(?:json)?\s*(\{.*?\})\s*```", re.DOTALL)
+_JSON_OBJ_RE = re.compile(r"\{.*\}", re.DOTALL)
+_JSON_DECODER = json.JSONDecoder()
+
+
+def parse_llm_json(content: str) -> Dict:
+    """从LLM回复中提取JSON对象（容忍markdown包裹和对象后的多余文字）"""
+    # 常见情况：直接返回了JSON对象，不必跑正则
+    stripped = content.strip()
+    if stripped.startswith("{"):
+        try:
+            return orjson.loads(stripped)
+        except orjson.JSONDecodeError:
+            pass
+
+    match = _JSON_BLOCK_RE.search(content)
+    if match:
+        payload = match.group(1)
+    else:
+        match = _JSON_OBJ_RE.search(content)
+        payload = match.group(0) if match else content.strip()
+
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        # 对象后面还跟着多余文字时，退回标准库逐段解析
+        result, _ = _JSON_DECODER.raw_decode(payload)
+        return result
+
+
 # 单例模式（可选）
 _llm_client_instance = None
 
@@ -299,29 +299,10 @@ class BusinessItemsTool(MCPTool):
             业务事项列表
         """
         try:
-            import os
-            data_file = os.path.join(os.path.dirname(__file__), "..", "..", "data", "business_items.json")
+            from app.api.business_items import query_items
 
-            if os.path.exists(data_file):
-                with open(data_file, 'r', encoding='utf-8') as f:
-                    items = json.load(f)
-            else:
-                items = []
-
-            # 过滤
-            filtered = items
-            if status:
-                filtered = [item for item in filtered if item.get("status") == status]
-            if priority:
-                filtered = [item for item in filtered if item.get("priority") == priority]
-            if item_type:
-                filtered = [item for item in filtered if item.get("type") == item_type]
-
-            # 排序：按更新时间倒序
-            filtered.sort(key=lambda x: x.get("updated_at", ""), reverse=True)
-
-            # 限制数量
-            filtered = filtered[:limit]
+            # 过滤、按更新时间倒序、限制数量（在业务事项库中完成）
+            filtered = query_items(type=item_type, status=status, priority=priority, limit=limit)
 
             # 统计
             stats = {
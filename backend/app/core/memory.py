@@ -2,10 +2,52 @@
 Memory Manager - 基于Mem0的记忆管理系统
 支持：添加、查询、勾选、删除记忆，以及来源溯源
 """
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
+from collections import OrderedDict
 from datetime import datetime
 from mem0 import Memory
-import json
+import asyncio
+import hashlib
+import os
+import threading
+import time
+
+# 查询向量缓存容量（重复查询直接命中，省去一次嵌入调用）
+EMBEDDING_CACHE_SIZE = 2048
+
+# 搜索结果缓存：容量与有效期（秒），记忆有增删改时整体失效
+SEARCH_CACHE_SIZE = 512
+SEARCH_CACHE_TTL = 30.0
+
+# 会议原文存储目录（每份原文只存一份，记忆元数据里只保存引用ID）
+RAW_NOTES_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "data", "raw_notes")
+
+
+def _unwrap_results(results: Any) -> List[Dict]:
+    """取出Mem0返回的结果列表（新版本为 {"results": [...]}，旧版本直接是列表）"""
+    try:
+        return results["results"]
+    except KeyError:
+        return []
+    except TypeError:
+        return results if isinstance(results, list) else []
+
+
+def _store_filters(
+    domain: Optional[str] = None,
+    level: Optional[str] = None,
+    scope: Optional[Dict] = None
+) -> Dict[str, Any]:
+    """domain/level/scope 转为向量库的等值过滤条件（scope 用嵌套字段 scope.<key>）"""
+    filters: Dict[str, Any] = {}
+    if domain:
+        filters["domain"] = domain
+    if level:
+        filters["level"] = level
+    if scope:
+        for key, value in scope.items():
+            filters[f"scope.{key}"] = value
+    return filters
 
 
 class MemoryItem:
@@ -18,7 +60,8 @@ class MemoryItem:
         memory_type: str,  # "global" | "scenario" | "interaction"
         enabled: bool = True,
         metadata: Optional[Dict] = None,
-        created_at: Optional[str] = None
+        created_at: Optional[str] = None,
+        score: float = 0.0
     ):
         self.id = id
         self.content = content
@@ -26,6 +69,7 @@ class MemoryItem:
         self.enabled = enabled
         self.metadata = metadata or {}
         self.created_at = created_at or datetime.now().isoformat()
+        self.score = score  # 语义搜索相似度（get_all时为0）
 
     def to_dict(self) -> Dict:
         """转换为字典"""
@@ -47,7 +91,8 @@ class MemoryItem:
             memory_type=result.get("metadata", {}).get("type", "global"),
             enabled=result.get("metadata", {}).get("enabled", True),
             metadata=result.get("metadata", {}),
-            created_at=result.get("created_at", datetime.now().isoformat())
+            created_at=result.get("created_at", datetime.now().isoformat()),
+            score=result.get("score") or 0.0
         )
 
 
@@ -56,15 +101,71 @@ class MemoryManager:
 
     def __init__(self):
         """初始化Mem0"""
+        # 向量缓存：sha256(规范化文本, 附加参数) -> 向量，Mem0可用时由 _install_embedding_cache 启用
+        self._embedding_cache: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._embedding_cache_lock = threading.Lock()
+        self._raw_embed = None
+
+        # 搜索结果缓存：key -> (过期时间, 记忆列表)
+        self._search_cache: "OrderedDict[tuple, Tuple[float, List[MemoryItem]]]" = OrderedDict()
+        self._search_cache_lock = threading.Lock()
+        self._search_version = 0
+
         try:
             # 初始化Mem0（本地模式，使用Qdrant作为向量数据库）
             self.memory = Memory()
+            self._install_embedding_cache()
             print("✅ Mem0初始化成功")
         except Exception as e:
             print(f"⚠️  Mem0初始化失败: {e}")
             print("   提示：如果首次使用，Mem0会自动下载嵌入模型")
             self.memory = None
 
+    def _install_embedding_cache(self):
+        """
+        为Mem0的嵌入模型加上LRU缓存
+
+        Mem0的search/add内部、LLM语义缓存和记忆去重都会调用 embedding_model.embed，
+        相同文本（忽略多余空白）只计算一次向量。缓存键为文本的SHA-256，不保留长提示词原文
+        """
+        embedder = self.memory.embedding_model
+        self._raw_embed = embedder.embed
+
+        def embed(text, *args):
+            if not isinstance(text, str):
+                return self._raw_embed(text, *args)
+            return list(self._cached_embed(text, *args))
+
+        embedder.embed = embed
+
+    @staticmethod
+    def _embedding_key(text: str, *args) -> bytes:
+        normalized = " ".join(text.split())
+        return hashlib.sha256(repr((normalized, args)).encode("utf-8")).digest()
+
+    def _get_cached_embedding(self, key: bytes) -> Optional[tuple]:
+        with self._embedding_cache_lock:
+            vector = self._embedding_cache.get(key)
+            if vector is not None:
+                self._embedding_cache.move_to_end(key)
+            return vector
+
+    def _put_cached_embedding(self, key: bytes, vector: tuple):
+        with self._embedding_cache_lock:
+            self._embedding_cache[key] = vector
+            self._embedding_cache.move_to_end(key)
+            while len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+
+    def _cached_embed(self, text: str, *args) -> tuple:
+        key = self._embedding_key(text, *args)
+        vector = self._get_cached_embedding(key)
+        if vector is None:
+            # 计算向量时不持锁，不同文本可以并发计算
+            vector = tuple(self._raw_embed(" ".join(text.split()), *args))
+            self._put_cached_embedding(key, vector)
+        return vector
+
     def add_memory(
         self,
         content: str,
@@ -105,18 +206,11 @@ class MemoryManager:
                 user_id=user_id,
                 metadata=full_metadata
             )
+            self._invalidate_search_cache()
 
-            # 处理不同的返回格式 - Mem0 可能返回列表或字典
-            memory_id = None
-            if isinstance(result, list):
-                # 列表格式：直接是结果列表
-                if result and len(result) > 0:
-                    memory_id = result[0].get("id") if isinstance(result[0], dict) else None
-            elif isinstance(result, dict):
-                # 字典格式：包含 "results" 键
-                results = result.get("results", [])
-                if results and len(results) > 0:
-                    memory_id = results[0].get("id") if isinstance(results[0], dict) else None
+            # 取第一条结果的ID - Mem0 可能返回列表或字典
+            results = _unwrap_results(result)
+            memory_id = results[0].get("id") if results and isinstance(results[0], dict) else None
 
             return {
                 "success": True,
@@ -130,6 +224,23 @@ class MemoryManager:
                 "error": f"添加记忆失败: {str(e)}"
             }
 
+    async def add_memories_bulk(self, items: List[Dict]) -> List[Dict]:
+        """
+        批量添加记忆（并发写入，每条可带不同的元数据）
+
+        Args:
+            items: add_memory 的参数字典列表
+
+        Returns:
+            与 items 一一对应的添加结果
+        """
+        if not items:
+            return []
+
+        return list(await asyncio.gather(
+            *[asyncio.to_thread(self.add_memory, **item) for item in items]
+        ))
+
     def search_memories(
         self,
         query: str,
@@ -160,14 +271,26 @@ class MemoryManager:
         if not self.memory:
             return []
 
+        cache_key = (
+            query, memory_type, enabled_only, user_id, limit, domain, level,
+            tuple(sorted(scope.items())) if scope else None
+        )
+        cached = self._get_cached_search(cache_key)
+        if cached is not None:
+            return cached
+        version = self._search_version
+
         try:
             # 搜索记忆（添加异常捕获）
-            import asyncio
+            # domain/level/scope 是严格相等条件，直接下推到向量库过滤，
+            # 使返回的 limit 条都是候选，而不是先取 limit 条再在本地丢弃
+            store_filters = _store_filters(domain, level, scope)
             try:
                 results = self.memory.search(
                     query=query,
                     user_id=user_id,
-                    limit=limit
+                    limit=limit,
+                    filters=store_filters or None
                 )
             except Exception as search_err:
                 print(f"⚠️  搜索记忆时出错: {search_err}, 返回空结果")
@@ -175,25 +298,17 @@ class MemoryManager:
 
             # 解析结果 - Mem0 可能返回列表或字典
             memories = []
-
-            # 处理不同的返回格式
-            if isinstance(results, list):
-                result_list = results
-            elif isinstance(results, dict):
-                result_list = results.get("results", [])
-            else:
-                result_list = []
-
-            for result in result_list:
-                memory_item = MemoryItem.from_mem0_result(result)
-                md = memory_item.metadata or {}
+            # 先在原始结果上过滤，只为通过过滤的结果创建 MemoryItem
+            # （type/enabled 缺省即视为匹配，无法下推；domain/level/scope 再校验一次，兼容不支持嵌套字段过滤的向量库）
+            for result in _unwrap_results(results):
+                md = result.get("metadata") or {}
 
                 # 过滤：memory_type
-                if memory_type and memory_item.memory_type != memory_type:
+                if memory_type and md.get("type", "global") != memory_type:
                     continue
 
                 # 过滤：enabled
-                if enabled_only and not memory_item.enabled:
+                if enabled_only and not md.get("enabled", True):
                     continue
 
                 # 过滤：level（企业级/场景级）
@@ -204,26 +319,102 @@ class MemoryManager:
                 if domain and md.get("domain") != domain:
                     continue
 
-                # 过滤：scope（范围）
+                # 过滤：scope（范围），所有条件都需匹配
                 if scope:
-                    item_scope = md.get("scope", {})
-                    # 检查所有scope条件是否匹配
-                    match = True
-                    for key, value in scope.items():
-                        if item_scope.get(key) != value:
-                            match = False
-                            break
-                    if not match:
+                    item_scope = md.get("scope") or {}
+                    if any(item_scope.get(key) != value for key, value in scope.items()):
                         continue
 
-                memories.append(memory_item)
+                memories.append(MemoryItem.from_mem0_result(result))
+                if len(memories) >= limit:
+                    break
 
-            return memories
+            self._put_cached_search(cache_key, memories, version)
+            return list(memories)
 
         except Exception as e:
             print(f"搜索记忆失败: {e}")
             return []
 
+    def _get_cached_search(self, key: tuple) -> Optional[List[MemoryItem]]:
+        """读取搜索缓存（返回副本，调用方可自行排序）"""
+        with self._search_cache_lock:
+            entry = self._search_cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._search_cache[key]
+                return None
+            self._search_cache.move_to_end(key)
+            return list(entry[1])
+
+    def _put_cached_search(self, key: tuple, memories: List[MemoryItem], version: int):
+        """写入搜索缓存；搜索期间记忆有变化则不写入"""
+        with self._search_cache_lock:
+            if version != self._search_version:
+                return
+            self._search_cache[key] = (time.monotonic() + SEARCH_CACHE_TTL, memories)
+            self._search_cache.move_to_end(key)
+            while len(self._search_cache) > SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+
+    @property
+    def memory_version(self) -> int:
+        """记忆版本号：每次增删改（含勾选）后递增，依赖记忆内容的缓存可用它做键"""
+        return self._search_version
+
+    def _invalidate_search_cache(self):
+        """记忆增删改后清空搜索缓存"""
+        with self._search_cache_lock:
+            self._search_version += 1
+            self._search_cache.clear()
+
+    def embed_query(self, text: str) -> Optional[List[float]]:
+        """
+        计算查询文本的向量
+
+        Args:
+            text: 查询文本
+
+        Returns:
+            向量，失败返回None
+        """
+        if not self.memory:
+            return None
+
+        try:
+            return self.memory.embedding_model.embed(text)
+        except Exception as e:
+            print(f"⚠️  计算查询向量失败: {e}")
+            return None
+
+    def embed_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        批量计算向量：命中缓存的直接返回，重复文本只计算一次
+
+        Args:
+            texts: 文本列表
+
+        Returns:
+            与texts一一对应的向量，失败的位置为None
+        """
+        if not self.memory:
+            return [None] * len(texts)
+
+        keys = [self._embedding_key(text) for text in texts]
+        vectors: Dict[bytes, Optional[tuple]] = {}
+        for key, text in zip(keys, texts):
+            if key in vectors:
+                continue
+            vector = self._get_cached_embedding(key)
+            if vector is None:
+                try:
+                    vector = self._cached_embed(text)
+                except Exception as e:
+                    print(f"⚠️  计算查询向量失败: {e}")
+            vectors[key] = vector
+        return [list(vectors[key]) if vectors[key] is not None else None for key in keys]
+
     def get_all_memories(
         self,
         user_id: str = "system",
@@ -252,21 +443,11 @@ class MemoryManager:
 
             # 解析结果 - Mem0 可能返回列表或字典
             memories = []
-
-            # 处理不同的返回格式
-            if isinstance(results, list):
-                result_list = results
-            elif isinstance(results, dict):
-                result_list = results.get("results", [])
-            else:
-                result_list = []
-
-            for result in result_list:
-                memory_item = MemoryItem.from_mem0_result(result)
-                md = memory_item.metadata or {}
+            for result in _unwrap_results(results):
+                md = result.get("metadata") or {}
 
                 # 过滤：memory_type
-                if memory_type and memory_item.memory_type != memory_type:
+                if memory_type and md.get("type", "global") != memory_type:
                     continue
 
                 # 过滤：level
@@ -277,7 +458,7 @@ class MemoryManager:
                 if domain and md.get("domain") != domain:
                     continue
 
-                memories.append(memory_item)
+                memories.append(MemoryItem.from_mem0_result(result))
 
             return memories
 
@@ -312,6 +493,7 @@ class MemoryManager:
                 memory_id=memory_id,
                 data={"enabled": enabled}
             )
+            self._invalidate_search_cache()
 
             return {
                 "success": True,
@@ -345,6 +527,7 @@ class MemoryManager:
         try:
             # 删除记忆
             self.memory.delete(memory_id=memory_id)
+            self._invalidate_search_cache()
 
             return {
                 "success": True,
@@ -357,6 +540,125 @@ class MemoryManager:
                 "error": f"删除记忆失败: {str(e)}"
             }
 
+    def find_memory_ids(
+        self,
+        user_id: str = "system",
+        domain: Optional[str] = None,
+        level: Optional[str] = None,
+        scope: Optional[Dict] = None,
+        limit: int = 10000
+    ) -> List[str]:
+        """
+        按元数据条件列出记忆ID（不做语义搜索，不计算查询向量）
+
+        条件直接下推到向量库按payload过滤，只返回匹配的记忆，
+        不会像语义搜索那样受 limit 截断而漏掉匹配项
+
+        Args:
+            user_id: 用户ID
+            domain: 记忆域过滤
+            level: 记忆层级过滤
+            scope: 范围过滤（如：{"customerId": "U001"}）
+            limit: 最多返回数量
+
+        Returns:
+            记忆ID列表（包含已停用的记忆）
+        """
+        if not self.memory:
+            return []
+
+        try:
+            filters = {"user_id": user_id, **_store_filters(domain, level, scope)}
+            listed = self.memory.vector_store.list(filters=filters, limit=limit)
+            # Qdrant 的 scroll 返回 (points, next_offset)
+            points = listed[0] if isinstance(listed, tuple) else listed
+
+            ids = []
+            for point in points or []:
+                # 再校验一次，兼容不支持嵌套字段过滤的向量库
+                payload = getattr(point, "payload", None) or {}
+                if domain and payload.get("domain") != domain:
+                    continue
+                if level and payload.get("level") != level:
+                    continue
+                if scope:
+                    item_scope = payload.get("scope") or {}
+                    if any(item_scope.get(key) != value for key, value in scope.items()):
+                        continue
+                ids.append(str(point.id))
+            return ids
+
+        except Exception as e:
+            print(f"列出记忆失败: {e}")
+            return []
+
+    def delete_memories(
+        self,
+        memory_ids: List[str],
+        user_id: str = "system"
+    ) -> int:
+        """
+        批量删除记忆（搜索缓存只在最后失效一次）
+
+        Mem0没有按ID批量删除的接口，这里在同一次调用内逐条删除；
+        不并发执行，因为Mem0的历史库连接不是线程安全的
+
+        Args:
+            memory_ids: 记忆ID列表
+            user_id: 用户ID
+
+        Returns:
+            成功删除的数量
+        """
+        if not self.memory or not memory_ids:
+            return 0
+
+        deleted = 0
+        for memory_id in memory_ids:
+            try:
+                self.memory.delete(memory_id=memory_id)
+                deleted += 1
+            except Exception as e:
+                print(f"⚠️  删除记忆 {memory_id} 失败: {e}")
+
+        if deleted:
+            self._invalidate_search_cache()
+        return deleted
+
+    def save_raw_notes(self, raw_notes: str) -> str:
+        """
+        保存会议原文
+
+        Args:
+            raw_notes: 会议记录原文
+
+        Returns:
+            原文引用ID（按内容哈希生成，相同原文只存一份）
+        """
+        raw_id = hashlib.sha256(raw_notes.encode("utf-8")).hexdigest()[:16]
+        path = os.path.join(RAW_NOTES_DIR, f"{raw_id}.txt")
+        if not os.path.exists(path):
+            os.makedirs(RAW_NOTES_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(raw_notes)
+        return raw_id
+
+    def get_raw_notes(self, raw_id: str) -> Optional[str]:
+        """
+        根据引用ID读取会议原文
+
+        Args:
+            raw_id: save_raw_notes 返回的ID
+
+        Returns:
+            原文，不存在返回None
+        """
+        try:
+            with open(os.path.join(RAW_NOTES_DIR, f"{os.path.basename(raw_id)}.txt"), "r", encoding="utf-8") as f:
+                return f.read()
+        except OSError:
+            return None
+
     def build_memory_context(
         self,
         query: str,
@@ -405,11 +707,14 @@ class MemoryManager:
 
 # 单例模式（可选）
 _memory_manager_instance = None
+_memory_manager_lock = threading.Lock()
 
 
 def get_memory_manager() -> MemoryManager:
     """获取记忆管理器单例"""
     global _memory_manager_instance
     if _memory_manager_instance is None:
-        _memory_manager_instance = MemoryManager()
+        with _memory_manager_lock:
+            if _memory_manager_instance is None:
+                _memory_manager_instance = MemoryManager()
     return _memory_manager_instance
@@ -0,0 +1,91 @@
+"""
+Memory Async - 异步接口中调用记忆管理器
+Mem0的接口都是同步的（向量检索、嵌入计算、写历史库），直接在 async 接口里调用会阻塞事件循环。
+这里统一放到线程中执行并加超时：对话链路的读操作超时降级为空结果，不拖慢对话
+（记忆管理接口传 degrade=False，超时抛出 asyncio.TimeoutError，由调用方返回错误）；
+写操作超时返回失败（线程中的写入无法取消，仍会在后台完成）
+"""
+from typing import Any, Dict, List, Optional
+import asyncio
+import os
+
+from app.core.memory import MemoryItem, MemoryManager
+
+# 检索类调用（搜索、嵌入计算）的超时（秒）
+MEMORY_READ_TIMEOUT = float(os.getenv("MEMORY_READ_TIMEOUT", "3.0"))
+# 记忆管理接口读取的超时（秒）：结果直接展示给用户，不能降级为空，首次检索还可能在加载嵌入模型
+MEMORY_ADMIN_READ_TIMEOUT = float(os.getenv("MEMORY_ADMIN_READ_TIMEOUT", "30.0"))
+# 写入类调用（添加、删除、勾选）的超时（秒），Mem0写入前要调用LLM抽取记忆，耗时更长
+MEMORY_WRITE_TIMEOUT = float(os.getenv("MEMORY_WRITE_TIMEOUT", "30.0"))
+
+
+async def _call(fn, *args, timeout: float, **kwargs):
+    return await asyncio.wait_for(asyncio.to_thread(fn, *args, **kwargs), timeout)
+
+
+async def search_memories_async(
+    manager: MemoryManager,
+    timeout: float = MEMORY_READ_TIMEOUT,
+    degrade: bool = True,
+    **kwargs
+) -> List[MemoryItem]:
+    """search_memories 的异步版本，超时返回空列表（degrade=False 时抛出 asyncio.TimeoutError）"""
+    try:
+        return await _call(manager.search_memories, timeout=timeout, **kwargs)
+    except asyncio.TimeoutError:
+        print(f"⚠️  搜索记忆超时（{timeout}s）" + ("，返回空结果" if degrade else ""))
+        if not degrade:
+            raise
+        return []
+
+
+async def get_all_memories_async(
+    manager: MemoryManager,
+    timeout: float = MEMORY_READ_TIMEOUT,
+    degrade: bool = True,
+    **kwargs
+) -> List[MemoryItem]:
+    """get_all_memories 的异步版本，超时返回空列表（degrade=False 时抛出 asyncio.TimeoutError）"""
+    try:
+        return await _call(manager.get_all_memories, timeout=timeout, **kwargs)
+    except asyncio.TimeoutError:
+        print(f"⚠️  获取记忆超时（{timeout}s）" + ("，返回空结果" if degrade else ""))
+        if not degrade:
+            raise
+        return []
+
+
+async def embed_query_async(
+    manager: MemoryManager,
+    text: str,
+    timeout: float = MEMORY_READ_TIMEOUT
+) -> Optional[Any]:
+    """embed_query 的异步版本，超时返回None（调用方按无向量处理）"""
+    try:
+        return await _call(manager.embed_query, text, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"⚠️  计算查询向量超时（{timeout}s）")
+        return None
+
+
+async def _write(fn, timeout: float, **kwargs) -> Dict:
+    try:
+        return await _call(fn, timeout=timeout, **kwargs)
+    except asyncio.TimeoutError:
+        print(f"⚠️  记忆写入超时（{timeout}s），将在后台继续完成")
+        return {"success": False, "error": f"记忆写入超时（{timeout}s）"}
+
+
+async def add_memory_async(manager: MemoryManager, timeout: float = MEMORY_WRITE_TIMEOUT, **kwargs) -> Dict:
+    """add_memory 的异步版本，超时返回失败结果"""
+    return await _write(manager.add_memory, timeout, **kwargs)
+
+
+async def delete_memory_async(manager: MemoryManager, timeout: float = MEMORY_WRITE_TIMEOUT, **kwargs) -> Dict:
+    """delete_memory 的异步版本，超时返回失败结果"""
+    return await _write(manager.delete_memory, timeout, **kwargs)
+
+
+async def toggle_memory_async(manager: MemoryManager, timeout: float = MEMORY_WRITE_TIMEOUT, **kwargs) -> Dict:
+    """toggle_memory 的异步版本，超时返回失败结果"""
+    return await _write(manager.toggle_memory, timeout, **kwargs)
@@ -0,0 +1,406 @@
+"""
+Memory Writer - 对话记忆后台写入
+对话接口只负责入队；后台worker攒批后用一次LLM调用判断整批对话是否值得保存，
+再批量写入Mem0（Mem0会自动判断新增还是合并已有记忆）
+"""
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Deque, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from app.core.llm import parse_llm_json
+from app.core.state import get_app_state
+
+logger = logging.getLogger(__name__)
+
+# 队列上限：积压超过该数量时新对话直接丢弃（只记日志），避免内存无限增长
+QUEUE_SIZE = int(os.getenv("MEMORY_WRITER_QUEUE_SIZE", "1000"))
+# 后台worker数量
+WORKERS = int(os.getenv("MEMORY_WRITER_WORKERS", str(os.cpu_count() or 2)))
+# 每批最多条数，以及攒批的最长等待时间（秒）
+MAX_BATCH = 16
+MAX_BATCH_WAIT = 0.5
+# 关闭时等待队列排空的最长时间（秒）
+SHUTDOWN_TIMEOUT = 10.0
+
+# 判断提示词里每段对话的问/答各自最多保留的字符数（长篇汇报只看开头即可判断）
+JUDGE_TURN_CHARS = 400
+# 判断调用的超时（秒），超时按关键词预筛选的结果保存
+JUDGE_TIMEOUT = float(os.getenv("LLM_JUDGMENT_TIMEOUT", "8.0"))
+# 判断结果缓存（重试/重新生成会产生相同的提问）
+JUDGMENT_CACHE_SIZE = 256
+JUDGMENT_CACHE_TTL = 600.0
+
+# 语义去重：与最近保存的记忆足够相似的提问直接跳过（不判断也不写入）
+RECENT_MEMORY_SIZE = 64
+DEDUPE_THRESHOLD = 0.9
+# 计算去重向量时提问最多取的字符数
+DEDUPE_QUERY_CHARS = 256
+
+# LLM不可用时按业务决策保存
+_FALLBACK_MEMORY_TYPE = "business_decision"
+
+
+# 判断规则固定在前，每批变化的对话内容放在最后
+_JUDGE_PROMPT_TMPL = """你是企业记忆管理助手，负责从CEO与决策助手的对话中提取**企业和业务相关**的关键信息。
+
+**重要原则：这是企业大脑，只记录企业经营相关的信息，不记录CEO的个人信息。**
+
+**应该保存的信息类型：**
+
+1. **工作偏好** (work_preference)
+   - CEO的决策风格、管理风格（作为工作方式）
+   - 会议习惯、汇报偏好
+   - 回答格式偏好（如"我希望看数据驱动的分析"）
+   - 注意：只记录**工作相关**的偏好
+
+2. **公司背景** (company_background)
+   - 公司名称、业务类型、商业模式
+   - 团队规模、组织架构
+   - 行业背景、市场定位
+   - **不包括CEO个人信息**（姓名、年龄、学历等）
+
+3. **业务决策和计划** (business_decision)
+   - 重要的战略决策
+   - 具体的行动计划
+   - 任务分配和责任人
+   - 明确的业务目标和截止时间
+
+4. **业务洞察** (business_insight)
+   - 关键业务指标和趋势
+   - 风险识别和分析
+   - 市场洞察、竞品分析
+   - 客户反馈和需求
+
+**明确排除的内容：**
+- ❌ CEO的个人信息：姓名、年龄、个人背景、家庭情况
+- ❌ 个人兴趣爱好：食物偏好、娱乐方式等
+- ❌ 简单问候和闲聊
+- ❌ 技术操作问题
+- ❌ 临时性、重复性内容
+
+**示例对比：**
+- ✅ "公司是50人的跨境电商团队" → 应该保存（company_background）
+- ❌ "我叫张三，今年30岁" → 不应该保存（个人信息）
+- ✅ "我偏好数据驱动的决策方式" → 应该保存（work_preference）
+- ❌ "我喜欢喝咖啡" → 不应该保存（个人喜好）
+
+**请对下面每一段对话分别判断，输出JSON格式：**
+{{
+  "results": [
+    {{
+      "index": 对话编号,
+      "should_save": true/false,
+      "memory_type": "work_preference/company_background/business_decision/business_insight/none",
+      "reason": "判断理由（简短）",
+      "summary": "如果需要保存，提取核心信息（1-2句话，客观陈述）"
+    }}
+  ]
+}}
+
+只输出JSON，不要其他内容。
+
+**对话内容：**
+{turns}"""
+
+
+@dataclass
+class ChatTurn:
+    """一轮待判断的对话"""
+    user_message: str
+    ai_reply: str
+    session_id: Optional[str] = None
+
+
+@dataclass
+class MemoryJudgment:
+    """LLM对一轮对话的判断结果"""
+    should_save: bool
+    memory_type: str = "none"
+    summary: Optional[str] = None
+
+
+def _clip(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= JUDGE_TURN_CHARS else text[:JUDGE_TURN_CHARS] + "…"
+
+
+def _judgment_key(turn: ChatTurn) -> str:
+    return hashlib.blake2b(turn.user_message[:200].encode("utf-8"), digest_size=16).hexdigest()
+
+
+class MemoryWriter:
+    """对话记忆后台写入器（有界队列 + 批量判断 + 批量写入）"""
+
+    def __init__(self, maxsize: int = QUEUE_SIZE):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._workers: List[asyncio.Task] = []
+        self.dropped = 0  # 队列已满被丢弃的对话数
+        # 最近保存的记忆对应提问的单位向量（float32）
+        self._recent: Deque[np.ndarray] = deque(maxlen=RECENT_MEMORY_SIZE)
+        self.deduped = 0  # 语义去重跳过的对话数
+        # 判断结果缓存: key -> (过期时间, 判断结果)
+        self._judgments: "OrderedDict[str, Tuple[float, MemoryJudgment]]" = OrderedDict()
+
+    def enqueue(self, user_message: str, ai_reply: str, session_id: Optional[str] = None) -> bool:
+        """
+        对话入队（不等待，队列已满时丢弃）
+
+        Returns:
+            是否成功入队
+        """
+        try:
+            self._queue.put_nowait(ChatTurn(user_message, ai_reply, session_id))
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning("⚠️ 记忆写入队列已满，丢弃本轮对话（累计丢弃 %d 条）", self.dropped)
+            return False
+
+    def start(self, workers: int = WORKERS):
+        """启动后台worker（需在事件循环中调用）"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"memory-writer-{i}")
+            for i in range(max(1, workers))
+        ]
+        logger.info("✅ 记忆写入worker已启动: %d 个", len(self._workers))
+
+    async def stop(self, timeout: float = SHUTDOWN_TIMEOUT):
+        """等待队列中的对话处理完（最多timeout秒），然后停止worker"""
+        if not self._workers:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ 关闭时仍有 %d 条对话未写入记忆", self._queue.qsize())
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._process_batch(batch)
+            except Exception:
+                logger.exception("⚠️ [后台] 批量保存记忆失败")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _next_batch(self) -> List[ChatTurn]:
+        """取一批对话：先等到第一条，再在 MAX_BATCH_WAIT 内尽量攒满 MAX_BATCH 条"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + MAX_BATCH_WAIT
+        while len(batch) < MAX_BATCH:
+            # 队列里已有的直接取走，不必等待
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _process_batch(self, batch: List[ChatTurn]):
+        """一次LLM调用判断整批对话，再批量写入需要保存的记忆"""
+        app_state = get_app_state()
+        if not app_state.memory_manager:
+            return
+
+        batch, embeddings = await self._drop_near_duplicates(batch, app_state.memory_manager)
+        if not batch:
+            return
+
+        logger.info("🤔 [后台] 判断 %d 轮对话是否需要保存到长期记忆...", len(batch))
+        judgments = await self._judge(batch, app_state.llm_client)
+
+        timestamp = str(datetime.now())
+        items = []
+        item_embeddings = []
+        for turn, judgment, embedding in zip(batch, judgments, embeddings):
+            if not judgment.should_save:
+                continue
+            item_embeddings.append(embedding)
+            items.append({
+                # 使用 LLM 提取的摘要（更精炼，易于去重）
+                "content": judgment.summary or f"CEO问: {turn.user_message}\nS8答: {turn.ai_reply}",
+                # 使用 "system" 作为 user_id，保证记忆全局可见
+                "user_id": "system",
+                "metadata": {
+                    "level": "enterprise",
+                    "domain": "enterprise",
+                    "category": judgment.memory_type,
+                    "timestamp": timestamp,
+                    "source": "s8_chat",
+                    "scope": {"sessionId": turn.session_id}
+                }
+            })
+
+        if not items:
+            logger.info("✗ [后台] 本批对话无需保存")
+            return
+
+        results = await app_state.memory_manager.add_memories_bulk(items)
+        saved = 0
+        for result, embedding in zip(results, item_embeddings):
+            if result.get("success"):
+                saved += 1
+                if embedding is not None:
+                    self._recent.append(embedding)
+        logger.info("💾 [后台] 记忆已保存: %d/%d", saved, len(items))
+
+    async def _drop_near_duplicates(
+        self,
+        batch: List[ChatTurn],
+        memory_manager
+    ) -> Tuple[List[ChatTurn], List[Optional[np.ndarray]]]:
+        """
+        去掉与最近保存的记忆语义重复的对话（换个说法再问一遍的情况），省去判断和写入
+
+        Returns:
+            (保留的对话, 对应提问的单位向量；无法计算向量时为None)
+        """
+        def embed_all() -> List[Optional[np.ndarray]]:
+            vectors = []
+            for turn in batch:
+                raw = memory_manager.embed_query(turn.user_message[:DEDUPE_QUERY_CHARS])
+                if raw is None:
+                    vectors.append(None)
+                    continue
+                vec = np.asarray(raw, dtype=np.float32)
+                norm = float(np.linalg.norm(vec))
+                vectors.append(vec / norm if norm else None)
+            return vectors
+
+        embeddings = await asyncio.to_thread(embed_all)
+        if not self._recent:
+            return batch, embeddings
+
+        recent = np.stack(self._recent)
+        kept, kept_embeddings = [], []
+        for turn, embedding in zip(batch, embeddings):
+            if (
+                embedding is not None
+                and embedding.shape[0] == recent.shape[1]
+                and float(np.max(recent @ embedding)) >= DEDUPE_THRESHOLD
+            ):
+                self.deduped += 1
+                logger.info("⏭️ [后台] 与最近保存的记忆语义重复，跳过（累计 %d 条）", self.deduped)
+                continue
+            kept.append(turn)
+            kept_embeddings.append(embedding)
+        return kept, kept_embeddings
+
+    def _get_cached_judgment(self, key: str) -> Optional[MemoryJudgment]:
+        entry = self._judgments.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._judgments[key]
+            return None
+        self._judgments.move_to_end(key)
+        return entry[1]
+
+    def _put_cached_judgment(self, key: str, judgment: MemoryJudgment):
+        self._judgments[key] = (time.monotonic() + JUDGMENT_CACHE_TTL, judgment)
+        self._judgments.move_to_end(key)
+        while len(self._judgments) > JUDGMENT_CACHE_SIZE:
+            self._judgments.popitem(last=False)
+
+    async def _judge(self, batch: List[ChatTurn], llm_client) -> List[MemoryJudgment]:
+        """批量判断；命中缓存的对话不再调用LLM"""
+        keys = [_judgment_key(turn) for turn in batch]
+        judgments: List[Optional[MemoryJudgment]] = [self._get_cached_judgment(key) for key in keys]
+        misses = [i for i, judgment in enumerate(judgments) if judgment is None]
+        if misses:
+            fresh, reliable = await self._judge_llm([batch[i] for i in misses], llm_client)
+            for i, judgment in zip(misses, fresh):
+                judgments[i] = judgment
+                # 备用方案的结果不缓存，下次仍交给LLM判断
+                if reliable:
+                    self._put_cached_judgment(keys[i], judgment)
+        return judgments
+
+    async def _judge_llm(self, batch: List[ChatTurn], llm_client) -> Tuple[List[MemoryJudgment], bool]:
+        """
+        一次LLM调用判断整批对话
+
+        LLM不可用、超时或解析失败时全部按业务决策保存（入队前已通过关键词预筛选）
+
+        Returns:
+            (判断结果, 是否来自LLM)
+        """
+        fallback = [MemoryJudgment(True, _FALLBACK_MEMORY_TYPE) for _ in batch]
+        if not llm_client:
+            return fallback, False
+
+        turns = "\n\n".join(
+            f"[{i}]\nCEO问：{_clip(turn.user_message)}\nS8答：{_clip(turn.ai_reply)}"
+            for i, turn in enumerate(batch)
+        )
+        try:
+            response = await asyncio.wait_for(
+                llm_client.async_chat_completion([
+                    {"role": "user", "content": _JUDGE_PROMPT_TMPL.format(turns=turns)}
+                ]),
+                JUDGE_TIMEOUT
+            )
+            if response.get("error"):
+                logger.warning("⚠️ LLM判断失败，使用关键词备用方案: %s", response["error"])
+                return fallback, False
+            results = parse_llm_json(response.get("content") or "{}").get("results") or []
+        except asyncio.TimeoutError:
+            logger.warning("⚠️ LLM判断超时（%.0fs），使用关键词备用方案", JUDGE_TIMEOUT)
+            return fallback, False
+        except Exception as e:
+            logger.warning("⚠️ LLM判断异常，使用关键词备用方案: %s", e)
+            return fallback, False
+
+        # 按编号对齐；LLM漏掉的对话视为无需保存
+        judgments = [MemoryJudgment(False) for _ in batch]
+        for result in results:
+            if not isinstance(result, dict):
+                continue
+            index = result.get("index")
+            if not isinstance(index, int) or not 0 <= index < len(batch):
+                continue
+            should_save = bool(result.get("should_save"))
+            judgments[index] = MemoryJudgment(
+                should_save,
+                result.get("memory_type", "none"),
+                (result.get("summary") or None) if should_save else None
+            )
+        return judgments, True
+
+# 单例
+_memory_writer_instance: Optional[MemoryWriter] = None
+_memory_writer_lock = threading.Lock()
+
+
+def get_memory_writer() -> MemoryWriter:
+    """获取记忆写入器单例"""
+    global _memory_writer_instance
+    if _memory_writer_instance is None:
+        with _memory_writer_lock:
+            if _memory_writer_instance is None:
+                _memory_writer_instance = MemoryWriter()
+    return _memory_writer_instance
@@ -0,0 +1,163 @@
+"""
+Response Cache - LLM回复缓存
+先按精确键命中，再按查询向量的余弦相似度做语义命中，避免重复调用LLM
+"""
+from typing import List, Optional, Sequence, Tuple
+from collections import OrderedDict
+import hashlib
+import time
+import numpy as np
+
+
+class SemanticResponseCache:
+    """语义回复缓存（有界LRU + TTL）"""
+
+    def __init__(self, capacity: int = 1024, ttl: float = 300.0, threshold: float = 0.92):
+        """
+        初始化缓存
+
+        Args:
+            capacity: 最大缓存条数
+            ttl: 过期时间（秒）
+            threshold: 语义命中的余弦相似度阈值
+        """
+        self.capacity = capacity
+        self.ttl = ttl
+        self.threshold = threshold
+
+        # key -> (过期时间, 回复, 作用域, 向量行号)
+        self._entries: "OrderedDict[str, Tuple[float, str, str, Optional[int]]]" = OrderedDict()
+
+        # 查询向量矩阵 (capacity, d)，首次写入向量时按维度分配
+        self._matrix: Optional[np.ndarray] = None
+        self._row_keys: List[Optional[str]] = [None] * capacity
+        self._free_rows: List[int] = list(range(capacity - 1, -1, -1))
+
+    @staticmethod
+    def make_key(prefix: str, user_message: str, scope: str = "") -> str:
+        """由 (系统提示词前缀, 作用域, 用户消息) 生成精确匹配键"""
+        digest = hashlib.sha256()
+        for part in (prefix, scope, user_message):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(
+        self,
+        key: str,
+        embedding: Optional[Sequence[float]] = None,
+        scope: str = ""
+    ) -> Optional[str]:
+        """
+        查询缓存
+
+        Args:
+            key: 精确匹配键（make_key生成）
+            embedding: 查询向量（可选，用于语义命中）
+            scope: 作用域，语义命中只在同一作用域内进行
+
+        Returns:
+            命中的回复，未命中返回None
+        """
+        now = time.monotonic()
+
+        # 1. 精确命中
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+            self._remove(key)
+
+        # 2. 语义命中
+        if embedding is None or self._matrix is None or not self._entries:
+            return None
+
+        query = self._normalize(embedding)
+        if query is None or query.shape[0] != self._matrix.shape[1]:
+            return None
+
+        sims = self._matrix @ query
+        for row in np.argsort(sims)[::-1]:
+            if sims[row] < self.threshold:
+                break
+            row_key = self._row_keys[row]
+            if row_key is None:
+                continue
+            expires_at, reply, entry_scope, _ = self._entries[row_key]
+            if expires_at <= now:
+                self._remove(row_key)
+                continue
+            if entry_scope != scope:
+                continue
+            self._entries.move_to_end(row_key)
+            return reply
+
+        return None
+
+    def put(
+        self,
+        key: str,
+        reply: str,
+        embedding: Optional[Sequence[float]] = None,
+        scope: str = ""
+    ):
+        """
+        写入缓存
+
+        Args:
+            key: 精确匹配键
+            reply: LLM回复
+            embedding: 查询向量（可选）
+            scope: 作用域
+        """
+        if key in self._entries:
+            self._remove(key)
+
+        while len(self._entries) >= self.capacity:
+            oldest_key, oldest = self._entries.popitem(last=False)
+            self._release_row(oldest_key, oldest[3])
+
+        row = None
+        vector = self._normalize(embedding) if embedding is not None else None
+        if vector is not None:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+            if vector.shape[0] == self._matrix.shape[1] and self._free_rows:
+                row = self._free_rows.pop()
+                self._matrix[row] = vector
+                self._row_keys[row] = key
+
+        self._entries[key] = (time.monotonic() + self.ttl, reply, scope, row)
+
+    def clear(self):
+        """清空缓存"""
+        self._entries.clear()
+        self._matrix = None
+        self._row_keys = [None] * self.capacity
+        self._free_rows = list(range(self.capacity - 1, -1, -1))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        """删除条目并释放向量行"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._release_row(key, entry[3])
+
+    def _release_row(self, key: str, row: Optional[int]):
+        """释放条目占用的向量行"""
+        if row is not None and self._row_keys[row] == key:
+            self._row_keys[row] = None
+            self._matrix[row] = 0.0
+            self._free_rows.append(row)
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> Optional[np.ndarray]:
+        """归一化向量，使点积即为余弦相似度"""
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        if not norm:
+            return None
+        return vector / norm
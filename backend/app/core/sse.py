@@ -0,0 +1,82 @@
+"""
+SSE - 流式对话响应
+事件帧直接用orjson编码为bytes；统一设置SSE响应头，
+并在LLM长时间无输出时发送心跳注释，避免代理/CDN因空闲超时断开连接
+"""
+from typing import AsyncIterator, Dict
+import asyncio
+
+from fastapi.responses import StreamingResponse
+import orjson
+
+# 空闲多久（秒）发送一次心跳
+KEEPALIVE_INTERVAL = 15.0
+
+# SSE注释行，浏览器EventSource会直接忽略
+_SSE_PING = b": ping\n\n"
+
+# 内容事件每个token一条：固定的前后缀预先编码，只对内容字符串做一次JSON转义
+_SSE_CONTENT_PREFIX = b'data: {"type":"content","content":'
+_SSE_CONTENT_SUFFIX = b'}\n\n'
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"  # 禁用Nginx缓冲
+}
+
+
+def sse_event(obj: Dict) -> bytes:
+    """序列化为一条SSE事件（bytes，可直接作为流式响应的一帧发送）"""
+    return b"data: " + orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
+SSE_DONE = sse_event({"type": "done"})
+
+
+def sse_content(content: str) -> bytes:
+    """内容事件，等价于 sse_event({"type": "content", "content": content})"""
+    return _SSE_CONTENT_PREFIX + orjson.dumps(content) + _SSE_CONTENT_SUFFIX
+
+
+async def _with_keepalive(stream: AsyncIterator[bytes], interval: float) -> AsyncIterator[bytes]:
+    """转发stream的每一帧；超过interval秒没有新帧时插入一条心跳"""
+    it = stream.__aiter__()
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(it.__anext__())
+            # 超时只发心跳，不取消正在等待的下一帧
+            done, _ = await asyncio.wait({pending}, timeout=interval)
+            if not done:
+                yield _SSE_PING
+                continue
+            try:
+                frame = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                return
+            pending = None
+            yield frame
+    finally:
+        # 客户端断开时：先结束正在等待的一帧，再关闭原生成器（触发其finally清理）
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        aclose = getattr(it, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def event_stream_response(stream: AsyncIterator[bytes], keepalive: float = KEEPALIVE_INTERVAL) -> StreamingResponse:
+    """
+    构造SSE响应
+
+    Args:
+        stream: 已编码好的SSE帧（bytes）
+        keepalive: 心跳间隔（秒），<=0 表示不发送心跳
+    """
+    if keepalive > 0:
+        stream = _with_keepalive(stream, keepalive)
+    return StreamingResponse(stream, media_type="text/event-stream", headers=SSE_HEADERS)
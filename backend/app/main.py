@@ -6,7 +6,12 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
+import atexit
+import logging
+import logging.handlers
 import os
+import queue
 from dotenv import load_dotenv
 
 # 导入API路由
@@ -17,11 +22,30 @@ from app.core.memory import MemoryManager
 from app.core.llm import LLMClient
 from app.core.mcp_client import MCPClient
 from app.core.local_mcp import launch_local_mcp_if_needed
+from app.core.agent import prewarm_scenarios
+from app.core.customer_service_kb import get_cs_kb
+from app.core.data_analyzer import get_data_analyzer
+from app.core.event_bus import get_event_bus
+from app.core.memory_writer import get_memory_writer
 from app.core.state import app_state, get_app_state
 
 # 加载环境变量
 load_dotenv()
 
+# 日志输出（LOG_LEVEL=DEBUG 时可看到事件总线的逐条分发日志）
+# 日志记录只入队，由后台线程写stderr，避免在事件循环里做同步I/O
+_log_queue: "queue.Queue" = queue.Queue(-1)
+_log_stream_handler = logging.StreamHandler()
+_log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream_handler)
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
+)
+_log_listener.start()
+# 进程退出时输出队列中剩余的日志
+atexit.register(_log_listener.stop)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -38,7 +62,11 @@ async def lifespan(app: FastAPI):
     if not openai_key:
         print("⚠️  警告: OPENAI_API_KEY 未设置")
     app_state.llm_client = LLMClient(api_key=openai_key)
+    # 复用记忆管理器的查询向量（带缓存）做LLM语义缓存
+    app_state.llm_client.set_embedder(app_state.memory_manager.embed_query)
     print("✅ LLM客户端初始化完成")
+    # 后台预热LLM连接，不阻塞启动
+    llm_prewarm = asyncio.create_task(app_state.llm_client.prewarm())
 
     # 初始化 MCP：支持两种模式
     # 1) http（默认）：使用 FEISHU_MCP_URL
@@ -66,6 +94,12 @@ async def lifespan(app: FastAPI):
         print(f"⚠️  警告: MCP客户端初始化失败: {e}")
         app_state.mcp_client = None
 
+    # 启动对话记忆后台写入worker
+    get_memory_writer().start()
+
+    # 预编译各场景的状态图
+    prewarm_scenarios(app_state.memory_manager, app_state.llm_client)
+
     print("🎉 平台启动成功！")
 
     yield
@@ -73,6 +107,22 @@ async def lifespan(app: FastAPI):
     # 关闭时清理
     print("👋 关闭平台...")
 
+    # 等待后台记忆写入队列处理完
+    await get_memory_writer().stop()
+
+    # 关闭LLM共享连接池
+    llm_prewarm.cancel()
+    await app_state.llm_client.aclose()
+
+    # 写回客服知识库中尚未落盘的修改
+    get_cs_kb().flush()
+
+    # 写回S6缓存中尚未落盘的metrics
+    get_data_analyzer().flush()
+
+    # 关闭事件总线的同步回调线程池
+    get_event_bus().shutdown()
+
 
 # 创建FastAPI应用
 app = FastAPI(
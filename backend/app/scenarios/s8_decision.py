@@ -7,7 +7,7 @@ import json
 from datetime import datetime
 from app.core.agent import ScenarioOrchestrator, AgentState, register_scenario
 from app.core.memory import MemoryManager
-from app.core.llm import LLMClient
+from app.core.llm import LLMClient, parse_llm_json
 from app.core.mcp import get_tool_registry
 from app.core.event_bus import get_event_bus, EventNames
 
@@ -185,28 +185,8 @@ class S8DecisionAgent(ScenarioOrchestrator):
                     "evidence_ids": []
                 }
 
-            # 提取JSON内容
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            else:
-                # 尝试找到JSON对象（从第一个 { 到最后一个 }）
-                start_idx = content.find('{')
-                end_idx = content.rfind('}')
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    content = content[start_idx:end_idx+1]
-
-            # 再次检查是否为空
-            if not content:
-                print(f"    ✗ 提取JSON后内容为空")
-                return {
-                    "summary_text": "JSON提取失败",
-                    "key_metrics": [],
-                    "evidence_ids": []
-                }
-
-            result = json.loads(content)
+            # 提取JSON内容（兼容markdown代码块包裹和前后多余文字）
+            result = parse_llm_json(content)
             result["evidence_ids"] = [m.id for m in memories]
             result["data_source"] = "analytics.json"
 
@@ -316,24 +296,8 @@ class S8DecisionAgent(ScenarioOrchestrator):
                 print(f"    ✗ LLM返回空内容")
                 return {"risks": []}
 
-            # 提取JSON内容
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            else:
-                # 尝试找到JSON对象（从第一个 { 到最后一个 }）
-                start_idx = content.find('{')
-                end_idx = content.rfind('}')
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    content = content[start_idx:end_idx+1]
-
-            # 再次检查是否为空
-            if not content:
-                print(f"    ✗ 提取JSON后内容为空")
-                return {"risks": []}
-
-            result = json.loads(content)
+            # 提取JSON内容（兼容markdown代码块包裹和前后多余文字）
+            result = parse_llm_json(content)
 
             # 补充evidence_ids
             for risk in result.get("risks", []):
@@ -452,24 +416,8 @@ class S8DecisionAgent(ScenarioOrchestrator):
                 print(f"    ✗ LLM返回空内容")
                 return {"actions": []}
 
-            # 提取JSON内容
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            else:
-                # 尝试找到JSON对象（从第一个 { 到最后一个 }）
-                start_idx = content.find('{')
-                end_idx = content.rfind('}')
-                if start_idx != -1 and end_idx != -1 and end_idx > start_idx:
-                    content = content[start_idx:end_idx+1]
-
-            # 再次检查是否为空
-            if not content:
-                print(f"    ✗ 提取JSON后内容为空")
-                return {"actions": []}
-
-            result = json.loads(content)
+            # 提取JSON内容（兼容markdown代码块包裹和前后多余文字）
+            result = parse_llm_json(content)
 
             # 补充evidence_ids
             for action in result.get("actions", []):
@@ -678,10 +626,7 @@ class S8DecisionAgent(ScenarioOrchestrator):
             )
 
             content = response.get("content", "")
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-
-            return json.loads(content)
+            return parse_llm_json(content)
 
         except Exception as e:
             print(f"    ✗ 判断失败: {e}")
@@ -731,11 +676,7 @@ class S8DecisionAgent(ScenarioOrchestrator):
                 temperature=0.6
             )
 
-            content = response.get("content", "")
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-
-            comparison = json.loads(content)
+            comparison = parse_llm_json(response.get("content") or "")
             comparison["old_version"] = "v1.0"
             comparison["new_version"] = "v2.0"
             comparison["trigger_source"] = [m.metadata.get("source", "未知") for m in trigger_memories]
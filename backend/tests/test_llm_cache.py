@@ -0,0 +1,67 @@
+"""
+LLMClient 响应缓存：规范化命中只吸收空白/句末标点/大小写差异
+"""
+import asyncio
+import unittest
+
+from app.core.llm import LLMClient
+from app.core.meeting_assistant import _CONFLICT_PROMPT_TMPL
+
+
+def _conflict_messages(old_decision: str, new_decision: str):
+    prompt = _CONFLICT_PROMPT_TMPL.format(
+        old_date="2025-01-01",
+        old_decision=old_decision,
+        new_date="2025-02-01",
+        new_decision=new_decision
+    )
+    return [{"role": "user", "content": prompt}]
+
+
+class FuzzyCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.client = LLMClient()
+        self.calls = []
+
+        async def fake_completion(messages, model, temperature, max_tokens):
+            self.calls.append(messages)
+            return {"content": f"R{len(self.calls)}", "finish_reason": "stop", "usage": None}
+
+        self.client._async_chat_completion = fake_completion
+
+    def _complete(self, messages):
+        return asyncio.run(self.client.async_chat_completion(messages=messages, temperature=0.2))
+
+    def test_conflict_template_different_decision_is_not_reused(self):
+        first = self._complete(_conflict_messages("重点投入抖音渠道，加大预算", "收缩抖音渠道投放"))
+        second = self._complete(_conflict_messages("重点投入抖音渠道，加大预算", "扩大抖音渠道投放"))
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertNotEqual(first["content"], second["content"])
+        self.assertNotIn("cached", second)
+
+    def test_whitespace_and_punctuation_edits_are_reused(self):
+        self._complete(_conflict_messages("重点投入抖音渠道，加大预算", "收缩抖音渠道投放"))
+        second = self._complete(_conflict_messages("重点投入抖音渠道，加大预算", "  收缩抖音渠道投放！"))
+
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(second["cached"])
+        self.assertEqual(self.client.cache_stats["fuzzy_hits"], 1)
+
+    def test_decimal_point_is_not_normalized_away(self):
+        self._complete([{"role": "user", "content": "把预算调整为15倍"}])
+        second = self._complete([{"role": "user", "content": "把预算调整为1.5倍"}])
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertNotIn("cached", second)
+
+    def test_minus_sign_is_not_normalized_away(self):
+        self._complete([{"role": "user", "content": "毛利率变化 5%"}])
+        second = self._complete([{"role": "user", "content": "毛利率变化 -5%"}])
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertNotIn("cached", second)
+
+
+if __name__ == "__main__":
+    unittest.main()